@@ -4,6 +4,7 @@ const int led_pin_535 = 9;
 const int led_pin_590 = 12;
 const int led_pin_670 = 10;
 
+const long BAUD_RATE = 115200;
 const int MAX_CHRS = 30;
 char commandBuffer[MAX_CHRS];
 
@@ -14,7 +15,7 @@ int LED_590_STATUS = 0;
 int LED_670_STATUS = 0;
 
 void setup() {
-  Serial.begin(9600);
+  Serial.begin(BAUD_RATE);
 
   pinMode(led_pin_460, OUTPUT);
   pinMode(led_pin_trans, OUTPUT);
@@ -25,8 +26,10 @@ void setup() {
 
 void loop() {
   handleSerial();  // Check and process serial input
+  updateLeds();
+}
 
-  // Update LED states
+void updateLeds() {
   digitalWrite(led_pin_460, LED_460_STATUS == 1 ? HIGH : LOW);
   digitalWrite(led_pin_trans, LED_TRANS_STATUS == 1 ? HIGH : LOW);
   digitalWrite(led_pin_535, LED_535_STATUS == 1 ? HIGH : LOW);
@@ -39,7 +42,9 @@ void handleSerial() {
     char c = Serial.read();
     if (c != ';') {
       c = toupper(c);
-      strncat(commandBuffer, &c, 1);
+      if (strlen(commandBuffer) < MAX_CHRS - 1) {
+        strncat(commandBuffer, &c, 1);
+      }
     } else {
       parseCommand(commandBuffer);
       memset(commandBuffer, 0, sizeof(commandBuffer));
@@ -51,13 +56,53 @@ void handleSerial() {
   if (strstr(command, "GET " #variableName) != NULL) { \
     Serial.print(#variableName " "); \
     Serial.println(variableName); \
+    return; \
   } else if (strstr(command, "SET " #variableName " ") != NULL) { \
     variableName = (typeof(variableName)) atof(command + (sizeof("SET " #variableName " ") - 1)); \
     Serial.print(#variableName " "); \
     Serial.println(variableName); \
+    return; \
   }
 
+// "SET LEDS tabcd;" sets all LEDs at once, one digit each in the order
+// TRANS 460 535 590 670 (e.g. "SET LEDS 01011;"). The pins are switched before
+// the single "LEDS tabcd" acknowledgement is sent. "GET LEDS;" reports them.
+void printLeds() {
+  Serial.print("LEDS ");
+  Serial.print(LED_TRANS_STATUS);
+  Serial.print(LED_460_STATUS);
+  Serial.print(LED_535_STATUS);
+  Serial.print(LED_590_STATUS);
+  Serial.println(LED_670_STATUS);
+}
+
+bool parseLeds(char* command) {
+  if (strncmp(command, "GET LEDS", 8) == 0) {
+    printLeds();
+    return true;
+  }
+  if (strncmp(command, "SET LEDS ", 9) != 0) {
+    return false;
+  }
+  char* digits = command + 9;
+  if (strlen(digits) < 5) {
+    Serial.println("ERR LEDS");
+    return true;
+  }
+  LED_TRANS_STATUS = digits[0] == '1';
+  LED_460_STATUS = digits[1] == '1';
+  LED_535_STATUS = digits[2] == '1';
+  LED_590_STATUS = digits[3] == '1';
+  LED_670_STATUS = digits[4] == '1';
+  updateLeds();
+  printLeds();
+  return true;
+}
+
 void parseCommand(char* command) {
+  if (parseLeds(command)) {
+    return;
+  }
   GET_AND_SET(LED_460_STATUS);
   GET_AND_SET(LED_535_STATUS);
   GET_AND_SET(LED_590_STATUS);
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+"""Headless acquisition throughput benchmarks, run against the simulated camera.
+
+Every capture mode (single image, timelapse, video, preview) is run across resolutions,
+bit depths and output formats. Each case runs in a fresh process so its peak RSS is its
+own. Results are written as JSON and can be compared with an earlier run:
+
+    python benchmarks/bench_acquisition.py --out bench.json
+    python benchmarks/bench_acquisition.py --quick --modes video preview --compare bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import platform
+import sys
+import tempfile
+import time as tm
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+import utils.cam_utils as cu
+from flir_camera_tools.backends import SimulatedBackend
+from utils.image_writer import ImageWriterPool
+from utils.preview import PreviewEngine
+from utils.scheduler import TimelapseScheduler
+
+RESOLUTIONS = {"1.6MP": (1440, 1080), "5MP": (2448, 2048)}
+BIT_DEPTHS = [8, 16]
+FORMATS = [("png", 1), ("png", 9), ("tiff", 0)]
+MODES = ["single", "timelapse", "video", "preview"]
+
+
+class TimedCamera:
+    """Wraps a camera backend and records how long each get_frame() call takes."""
+
+    def __init__(self, cam):
+        self.cam = cam
+        self.grab_ms = []
+
+    def __getattr__(self, name):
+        return getattr(self.cam, name)
+
+    def get_frame(self, timeout_ms=1000, process=None):
+        t0 = tm.perf_counter()
+        result = self.cam.get_frame(timeout_ms, process)
+        self.grab_ms.append((tm.perf_counter() - t0) * 1000)
+        return result
+
+
+def percentiles(values):
+    if not len(values):
+        return None
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(np.max(values))}
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None if it cannot be measured."""
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3  # bytes on macOS, KB elsewhere
+    except ImportError:
+        pass
+    try:
+        import psutil
+
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1e6
+    except ImportError:
+        return None
+
+
+def writer_stages(writer):
+    return {
+        "encode_ms": percentiles([r["encode_ms"] for r in writer.records]),
+        "write_ms": percentiles([r["write_ms"] for r in writer.records]),
+    }
+
+
+def bench_single(cam, out_dir, case, n_frames):
+    capture_ms = []
+    with ImageWriterPool(case["format"], case["compression"]) as writer:
+        t0 = tm.perf_counter()
+        for i in range(n_frames):
+            t = tm.perf_counter()
+            cu.run_single_image(cam, out_dir, "bench", f"{i:06d}", writer=writer)
+            capture_ms.append((tm.perf_counter() - t) * 1000)
+        writer.flush()
+        elapsed = tm.perf_counter() - t0
+    return {"frames": n_frames, "fps": n_frames / elapsed,
+            "stages": {"grab_ms": percentiles(cam.grab_ms), "capture_ms": percentiles(capture_ms),
+                       **writer_stages(writer)}}
+
+
+def bench_timelapse(cam, out_dir, case, n_frames, interval_s):
+    writer = ImageWriterPool(case["format"], case["compression"])
+
+    def capture(i):
+        frame, _ = cu.grab_image(cam)
+        writer.submit(frame, os.path.join(out_dir, f"bench_{i:06d}"))
+
+    scheduler = TimelapseScheduler(capture, n_frames, interval_s)
+    t0 = tm.perf_counter()
+    scheduler.run()
+    writer.close()
+    elapsed = tm.perf_counter() - t0
+    return {"frames": n_frames, "fps": n_frames / elapsed, "interval_s": interval_s,
+            "stages": {"grab_ms": percentiles(cam.grab_ms),
+                       "jitter_ms": percentiles([e["jitter_ms"] for e in scheduler.log]),
+                       **writer_stages(writer)}}
+
+
+def bench_video(cam, out_dir, case, seconds):
+    container = "raw" if case["format"] == "raw" else "avi"
+    stats = cu.run_video(cam, seconds, out_dir, "bench", "000000", fps=cam.framerate, container=container)
+    return {"frames": stats["written"], "fps": stats["written"] / seconds, "dropped": stats["dropped"],
+            "queue_high_water": stats["queue_high_water"], "stages": {"grab_ms": percentiles(cam.grab_ms)}}
+
+
+def bench_preview(cam, out_dir, case, seconds):
+    engine = PreviewEngine(cam)
+    shown, frame_id = 0, 0
+    engine.start()
+    t0 = tm.perf_counter()
+    while tm.perf_counter() - t0 < seconds:
+        new_id, frame = engine.latest(frame_id)
+        if frame is not None:
+            frame_id = new_id
+            shown += 1
+        tm.sleep(1 / 60)  # a GUI refreshing at 60 Hz
+    engine.stop()
+    elapsed = tm.perf_counter() - t0
+    return {"frames": frame_id, "fps": frame_id / elapsed, "shown_fps": shown / elapsed,
+            "stages": {"grab_and_render_ms": percentiles(cam.grab_ms)}}
+
+
+def run_case(case):
+    """Runs one benchmark case. Meant to be called in a fresh process."""
+    w, h = RESOLUTIONS[case["resolution"]]
+    cam = TimedCamera(SimulatedBackend(w, h, framerate=case["camera_fps"], bit_depth=case["bit_depth"]))
+    cam.open()
+    with tempfile.TemporaryDirectory() as out_dir, contextlib.redirect_stdout(io.StringIO()):
+        if case["mode"] == "single":
+            result = bench_single(cam, out_dir, case, case["frames"])
+        elif case["mode"] == "timelapse":
+            result = bench_timelapse(cam, out_dir, case, case["frames"], case["interval_s"])
+        elif case["mode"] == "video":
+            result = bench_video(cam, out_dir, case, case["seconds"])
+        else:
+            result = bench_preview(cam, out_dir, case, case["seconds"])
+    cam.close()
+    return {**case, **result, "peak_rss_mb": peak_rss_mb()}
+
+
+def build_cases(args):
+    cases = []
+    for mode in args.modes:
+        for res in args.resolutions:
+            for depth in args.bit_depths:
+                base = {"mode": mode, "resolution": res, "bit_depth": depth, "camera_fps": args.camera_fps,
+                        "frames": args.frames, "seconds": args.seconds, "interval_s": args.interval}
+                if mode in ("single", "timelapse"):
+                    for fmt, compression in FORMATS:
+                        cases.append({**base, "format": fmt, "compression": compression})
+                elif mode == "video":
+                    if depth == 8:  # the AVI writer only takes 8-bit frames
+                        cases.append({**base, "format": "avi", "compression": 0})
+                    cases.append({**base, "format": "raw", "compression": 0})
+                else:
+                    cases.append({**base, "format": None, "compression": None})
+    return cases
+
+
+def case_key(r):
+    return r["mode"], r["resolution"], r["bit_depth"], r["format"], r["compression"]
+
+
+def compare(results, previous_path):
+    with open(previous_path) as f:
+        previous = {case_key(r): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {previous_path}:")
+    for r in results:
+        old = previous.get(case_key(r))
+        if old and old["fps"]:
+            change = (r["fps"] / old["fps"] - 1) * 100
+            flag = "  ⚠️" if change < -10 else ""
+            print(f"  {' '.join(str(k) for k in case_key(r)):<40} {old['fps']:8.1f} -> {r['fps']:8.1f} fps "
+                  f"({change:+.0f}%){flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--resolutions", nargs="+", choices=list(RESOLUTIONS), default=list(RESOLUTIONS))
+    parser.add_argument("--bit-depths", nargs="+", type=int, choices=BIT_DEPTHS, default=BIT_DEPTHS)
+    parser.add_argument("--frames", type=int, default=50, help="frames per single/timelapse case")
+    parser.add_argument("--seconds", type=float, default=10.0, help="duration of video/preview cases")
+    parser.add_argument("--interval", type=float, default=0.0,
+                        help="timelapse interval in seconds (0 runs frames back to back)")
+    parser.add_argument("--camera-fps", type=float, default=200.0, help="frame rate of the simulated camera")
+    parser.add_argument("--quick", action="store_true", help="few frames and short runs, for a smoke test")
+    parser.add_argument("--out", default=f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    parser.add_argument("--compare", help="earlier results file to compare fps against")
+    args = parser.parse_args()
+    if args.quick:
+        args.frames, args.seconds = 5, 2.0
+
+    cases = build_cases(args)
+    results = []
+    ctx = mp.get_context("spawn")
+    for i, case in enumerate(cases):
+        with ctx.Pool(1) as pool:
+            result = pool.apply(run_case, (case,))
+        results.append(result)
+        rss = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] is not None else "n/a"
+        print(f"[{i+1}/{len(cases)}] {' '.join(str(k) for k in case_key(result)):<40} "
+              f"{result['fps']:8.1f} fps   peak RSS {rss}")
+
+    meta = {"date": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+            "platform": platform.platform(), "machine": platform.node(), "numpy": np.__version__,
+            "opencv": cv2.__version__, "cpu_count": os.cpu_count()}
+    with open(args.out, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"💾 Results saved: {args.out}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
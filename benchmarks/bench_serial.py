@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""Latency of switching the whole light state, against the fake Arduino.
+
+Compares the per-LED commands (one "SET LED_<x>_STATUS" per LED, each echoed) with the
+batched "SET LEDS" command at the old and new baud rates:
+
+    python benchmarks/bench_serial.py --repeats 200
+"""
+
+import argparse
+import os
+import sys
+import time as tm
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from utils.led_protocol import LED_ORDER, FakeArduino, set_all_leds
+
+
+def per_led(dev, states):
+    for name in LED_ORDER:
+        dev.write(f"SET LED_{name}_STATUS {states[name]};".encode())
+    for _ in LED_ORDER:
+        dev.readline()
+
+
+def batched(dev, states):
+    set_all_leds(dev, states)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=100)
+    args = parser.parse_args()
+
+    states = [{name: (i + j) % 2 for j, name in enumerate(LED_ORDER)} for i in range(2)]
+    for baud in (9600, 115200):
+        for label, switch in (("per-LED", per_led), ("batched", batched)):
+            dev = FakeArduino(baudrate=baud)
+            times = []
+            for i in range(args.repeats):
+                t0 = tm.perf_counter()
+                switch(dev, states[i % 2])
+                times.append((tm.perf_counter() - t0) * 1000)
+            p50, p95 = np.percentile(times, [50, 95])
+            print(f"{baud:>6} baud  {label:<8} p50 {p50:6.2f} ms   p95 {p95:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1 @@
-__all__ = ["cam_tools"]
+__all__ = ["cam_tools", "backends", "frame_buffer"]
@@ -0,0 +1,458 @@
+"""A single camera interface over the SDKs the phenotype-o-mat can drive.
+
+Every backend offers the same calls: open(), configure(), start(), get_frame(), stop()
+and close(). The SDKs are only imported when a backend is opened, so a machine without
+PySpin or gxipy can still use the others, including the simulated camera."""
+
+import abc
+import importlib.util
+import time as tm
+
+import numpy as np
+
+from utils.tracing import tracer
+
+
+class CameraNotFound(RuntimeError):
+    """Raised by open() when there is no camera at the backend's index."""
+
+
+class CameraBackend(abc.ABC):
+    """Base class for camera backends. Subclasses must implement every abstract method, or
+    they cannot be instantiated.
+
+    get_frame() returns (frame, timestamp) where 'frame' is an array the caller owns, or
+    (None, timestamp) if the frame timed out or was incomplete. Passing 'process' lets the
+    caller work on the SDK buffer directly (decimate it, copy it into a preallocated slot,
+    ...) before it is handed back to the driver; its return value replaces the frame."""
+
+    name = "base"
+
+    def __init__(self):
+        self.serial = None
+        self.is_streaming = False
+
+    @abc.abstractmethod
+    def open(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def close(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def configure(self, exposure_us=None, framerate=None, width=None, height=None):
+        """Applies the given settings, leaving the others untouched. Returns True on success."""
+        raise NotImplementedError
+
+    def bayer_pattern(self):
+        """Returns the Bayer pattern ("BayerRG", ...) of the frames get_frame() returns if
+        they are raw sensor data to be demosaiced (see frame_ops.demosaic), else None."""
+        return None
+
+    @abc.abstractmethod
+    def resolution(self):
+        """Returns the current (width, height) of the frames."""
+        raise NotImplementedError
+
+    def sensor_mode(self):
+        """Returns the settings that change how bright a given exposure comes out, as a
+        dict with "gain" (dB) and "binning"; None for values the camera does not report."""
+        return {"gain": None, "binning": None}
+
+    @abc.abstractmethod
+    def get_node(self, name):
+        """Reads a GenICam feature by name (e.g. "ExposureTime"); None if the camera has no
+        readable feature of that name. Enumerations are returned by their symbolic name."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_node(self, name, value):
+        """Writes a GenICam feature by name. Returns True on success."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def start(self, newest_only=False):
+        """Starts streaming. With newest_only the driver drops old frames instead of queueing
+        them, which is what a live preview wants."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def stop(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_frame(self, timeout_ms=1000, process=None):
+        raise NotImplementedError
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        if self.is_streaming:
+            self.stop()
+        self.close()
+
+
+class SpinnakerBackend(CameraBackend):
+    """FLIR / Teledyne cameras through the Spinnaker SDK (PySpin)."""
+
+    name = "flir"
+
+    def __init__(self, index=0):
+        super().__init__()
+        self.index = index
+        self.cam = None
+        self._system = None
+        self._cam_list = None
+        self._newest_only = False
+
+    def open(self):
+        import PySpin as ps
+
+        self._ps = ps
+        self._system = ps.System.GetInstance()
+        self._cam_list = self._system.GetCameras()
+        if self._cam_list.GetSize() <= self.index:
+            self._cam_list.Clear()
+            self._system.ReleaseInstance()
+            raise CameraNotFound("No FLIR camera found.")
+        self.cam = self._cam_list[self.index]
+        self.cam.Init()
+        self.serial = self.cam.TLDevice.DeviceSerialNumber.GetValue()
+
+    def close(self):
+        if self.cam is not None:
+            self.cam.DeInit()
+            self.cam = None
+        if self._cam_list is not None:
+            self._cam_list.Clear()
+            self._cam_list = None
+        if self._system is not None:
+            self._system.ReleaseInstance()
+            self._system = None
+
+    def configure(self, exposure_us=None, framerate=None, width=None, height=None):
+        import flir_camera_tools.cam_tools as ct
+
+        ok = True
+        if width is not None and height is not None:
+            ok &= ct.set_resolution(self.cam, width, height)
+        if exposure_us is not None:
+            ok &= ct.set_expos_time(self.cam, exposure_us)
+        if framerate is not None:
+            ok &= ct.set_framerate(self.cam, framerate)
+        return ok
+
+    def resolution(self):
+        return self.cam.Width.GetValue(), self.cam.Height.GetValue()
+
+    def sensor_mode(self):
+        try:
+            return {"gain": round(self.cam.Gain.GetValue(), 2), "binning": self.cam.BinningHorizontal.GetValue()}
+        except self._ps.SpinnakerException as ex:
+            print("Error: %s" % ex)
+            return super().sensor_mode()
+
+    def get_node(self, name):
+        node = self.cam.GetNodeMap().GetNode(name)
+        if node is None or not self._ps.IsReadable(node):
+            return None
+        return self._ps.CValuePtr(node).ToString()
+
+    def set_node(self, name, value):
+        node = self.cam.GetNodeMap().GetNode(name)
+        if node is None or not self._ps.IsWritable(node):
+            print(f"Error: {name} is not writable")
+            return False
+        try:
+            self._ps.CValuePtr(node).FromString(str(value))
+            return True
+        except self._ps.SpinnakerException as ex:
+            print("Error: %s" % ex)
+            return False
+
+    def start(self, newest_only=False):
+        import flir_camera_tools.cam_tools as ct
+
+        if newest_only:
+            ct.set_acq_cont(self.cam)
+        # set either way: a previous newest_only start would otherwise keep dropping frames
+        ct.set_buffer_handling(self.cam, "NewestOnly" if newest_only else "OldestFirst")
+        self._newest_only = newest_only
+        self.cam.BeginAcquisition()
+        self.is_streaming = True
+
+    def stop(self):
+        import flir_camera_tools.cam_tools as ct
+
+        self.cam.EndAcquisition()
+        self.is_streaming = False
+        if self._newest_only:
+            # leave the camera queueing every frame for code that drives it directly
+            ct.set_buffer_handling(self.cam, "OldestFirst")
+            self._newest_only = False
+
+    def get_frame(self, timeout_ms=1000, process=None):
+        timestamp = tm.time()
+        try:
+            with tracer.span("camera.GetNextImage"):
+                img = self.cam.GetNextImage(timeout_ms)
+        except self._ps.SpinnakerException as ex:
+            print("Error: %s" % ex)
+            return None, timestamp
+        try:
+            if img.IsIncomplete():
+                return None, timestamp
+            with tracer.span("camera.GetNDArray"):
+                buf = img.GetNDArray()
+                # The buffer goes back to the driver on Release(), so it must not escape.
+                return (process(buf) if process else buf.copy()), timestamp
+        finally:
+            img.Release()
+
+
+class DahengBackend(CameraBackend):
+    """Daheng Imaging cameras through the Galaxy SDK (gxipy). Colour frames are returned
+    as RGB unless 'color' is False, in which case the raw sensor data is returned: a
+    third of the size and no demosaicing per frame, for the fastest captures. Raw Bayer
+    frames are converted later with frame_ops.demosaic(frames, cam.bayer_pattern())."""
+
+    name = "daheng"
+
+    def __init__(self, index=1, color=True):
+        super().__init__()
+        self.index = index
+        self.color = color
+        self.cam = None
+        self._flush_queue = False
+
+    def open(self):
+        import flir_camera_tools.daheng_cam_tools as dt
+
+        device_manager = dt.load_sdk().DeviceManager()
+        device_manager.update_device_list()
+        if len(device_manager.get_all_device_info()) < self.index:
+            raise CameraNotFound("No Daheng cameras found.")
+        self.cam = device_manager.open_device_by_index(self.index)
+        self.serial = self.cam.DeviceSerialNumber.get()
+
+    def close(self):
+        if self.cam is not None:
+            self.cam.close_device()
+            self.cam = None
+
+    def configure(self, exposure_us=None, framerate=None, width=None, height=None):
+        import flir_camera_tools.daheng_cam_tools as dt
+
+        try:
+            if width is not None and height is not None:
+                dt.set_resolution(self.cam, width, height)
+            if exposure_us is not None:
+                dt.set_expos_time(self.cam, exposure_us)
+            if framerate is not None:
+                dt.set_framerate(self.cam, framerate)
+            return True
+        except Exception as ex:
+            print("Error: %s" % ex)
+            return False
+
+    def resolution(self):
+        return self.cam.Width.get(), self.cam.Height.get()
+
+    def bayer_pattern(self):
+        import flir_camera_tools.daheng_cam_tools as dt
+
+        return None if self.color else dt.bayer_pattern(self.cam)
+
+    def sensor_mode(self):
+        try:
+            return {"gain": round(self.cam.Gain.get(), 2), "binning": self.cam.BinningHorizontal.get()}
+        except Exception as ex:
+            print("Error: %s" % ex)
+            return super().sensor_mode()
+
+    def get_node(self, name):
+        feature = getattr(self.cam, name, None)
+        if feature is None or not feature.is_readable():
+            return None
+        value = feature.get()
+        return value[1] if isinstance(value, tuple) else value  # enums come as (value, symbol)
+
+    def set_node(self, name, value):
+        try:
+            getattr(self.cam, name).set(value)
+            return True
+        except Exception as ex:
+            print("Error: %s" % ex)
+            return False
+
+    def start(self, newest_only=False):
+        import flir_camera_tools.daheng_cam_tools as dt
+
+        mode_set = dt.set_buffer_handling(self.cam, newest_only)
+        # without the buffer mode, newest_only falls back to emptying the queue before each grab
+        self._flush_queue = newest_only and not mode_set
+        self.cam.stream_on()
+        self.is_streaming = True
+
+    def stop(self):
+        self.cam.stream_off()
+        self.is_streaming = False
+
+    def get_frame(self, timeout_ms=1000, process=None):
+        timestamp = tm.time()
+        with tracer.span("camera.get_image"):
+            if self._flush_queue:
+                self.cam.data_stream[0].flush_queue()
+            raw = self.cam.data_stream[0].get_image(timeout=timeout_ms)
+        if raw is None:
+            return None, timestamp
+        with tracer.span("camera.convert"):
+            img = raw.convert("RGB") if self.color else raw
+            buf = img.get_numpy_array()
+            return (process(buf) if process else buf.copy()), timestamp
+
+
+class SimulatedBackend(CameraBackend):
+    """A camera that needs no hardware. It produces a drifting synthetic pattern with
+    noise at the configured resolution, bit depth and frame rate, so every acquisition
+    path can be exercised and benchmarked on any machine. 'brightness' scales the image
+    and can be changed at any time to mimic a change in lighting."""
+
+    name = "sim"
+
+    def __init__(self, width=1440, height=1080, framerate=30.0, bit_depth=8, exposure_us=10000, serial="SIM0"):
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self.bit_depth = bit_depth
+        self.exposure_us = exposure_us
+        self.brightness = 1.0
+        self.serial = serial
+        self.node_writes = 0  # how many set_node() calls reached the "camera"
+        self._nodes = {"PixelFormat": "Mono8" if bit_depth <= 8 else "Mono16", "BinningHorizontal": 1,
+                       "BinningVertical": 1, "OffsetX": 0, "OffsetY": 0, "ExposureAuto": "Off",
+                       "GainAuto": "Off", "Gain": 0.0, "AcquisitionFrameRateEnable": True}
+        self._base = None
+        self._frame_id = 0
+        self._next_due = 0.0
+
+    def open(self):
+        self._build_pattern()
+
+    def close(self):
+        self._base = None
+
+    def configure(self, exposure_us=None, framerate=None, width=None, height=None):
+        if exposure_us is not None:
+            self.exposure_us = exposure_us
+        if framerate is not None:
+            self.framerate = framerate
+        if width is not None and height is not None:
+            self.width, self.height = width, height
+            self._build_pattern()
+        return True
+
+    def resolution(self):
+        return self.width, self.height
+
+    def sensor_mode(self):
+        return {"gain": self._nodes["Gain"], "binning": self._nodes["BinningHorizontal"]}
+
+    def get_node(self, name):
+        if name in ("Width", "Height", "ExposureTime", "AcquisitionFrameRate"):
+            return {"Width": self.width, "Height": self.height, "ExposureTime": self.exposure_us,
+                    "AcquisitionFrameRate": self.framerate}[name]
+        return self._nodes.get(name)
+
+    def set_node(self, name, value):
+        self.node_writes += 1
+        if name == "ExposureTime":
+            self.exposure_us = value
+        elif name == "AcquisitionFrameRate":
+            self.framerate = value
+        elif name in ("Width", "Height"):
+            setattr(self, name.lower(), int(value))
+            self._build_pattern()
+        elif name in self._nodes:
+            self._nodes[name] = value
+        else:
+            print(f"Error: {name} is not writable")
+            return False
+        return True
+
+    def start(self, newest_only=False):
+        self._next_due = tm.monotonic()
+        self.is_streaming = True
+
+    def stop(self):
+        self.is_streaming = False
+
+    def get_frame(self, timeout_ms=1000, process=None):
+        # Pace frames like a free-running camera: never faster than the frame rate.
+        wait = self._next_due - tm.monotonic()
+        if wait > timeout_ms / 1000:
+            tm.sleep(timeout_ms / 1000)
+            return None, tm.time()
+        if wait > 0:
+            tm.sleep(wait)
+        self._next_due = max(self._next_due, tm.monotonic() - 1 / self.framerate) + 1 / self.framerate
+        timestamp = tm.time()
+
+        self._frame_id += 1
+        buf = np.roll(self._base, self._frame_id % self.width, axis=1)
+        gain = self.brightness * min(self.exposure_us / 10000, 4.0)
+        if gain != 1.0:
+            max_val = 2**self.bit_depth - 1
+            buf = np.clip(buf * gain, 0, max_val).astype(buf.dtype)
+        return (process(buf) if process else buf), timestamp
+
+    def _build_pattern(self):
+        dtype = np.uint8 if self.bit_depth <= 8 else np.uint16
+        max_val = 2**self.bit_depth - 1
+        rng = np.random.default_rng(0)
+        x = np.linspace(0, 4 * np.pi, self.width, dtype=np.float32)
+        y = np.linspace(0, 3 * np.pi, self.height, dtype=np.float32)
+        pattern = 0.5 + 0.25 * np.sin(x)[None, :] + 0.15 * np.cos(y)[:, None]
+        pattern += rng.normal(0, 0.03, (self.height, self.width)).astype(np.float32)
+        self._base = (np.clip(pattern, 0, 1) * max_val * 0.5).astype(dtype)
+
+
+BACKENDS = {"flir": SpinnakerBackend, "daheng": DahengBackend, "sim": SimulatedBackend}
+SDK_MODULES = {"flir": "PySpin", "daheng": "gxipy"}
+
+
+def available_backends():
+    """Names of the backends whose SDK is installed, found without importing any SDK."""
+    return [kind for kind in BACKENDS
+            if kind not in SDK_MODULES or importlib.util.find_spec(SDK_MODULES[kind]) is not None]
+
+
+def open_camera(kind="flir", **kwargs):
+    """Creates and opens a camera backend by name: "flir", "daheng" or "sim"."""
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown camera backend: {kind}")
+    cam = BACKENDS[kind](**kwargs)
+    cam.open()
+    return cam
+
+
+def open_cameras(kind="flir", n=None, **kwargs):
+    """Opens every connected camera of a backend, or the first n. For "sim", n simulated
+    cameras (default 1) are created with serials SIM0, SIM1, ..."""
+    if kind == "sim":
+        return [open_camera("sim", serial=f"SIM{i}", **kwargs) for i in range(n or 1)]
+    cams = []
+    index = 1 if kind == "daheng" else 0  # gxipy counts devices from 1
+    while n is None or len(cams) < n:
+        try:
+            cams.append(open_camera(kind, index=index, **kwargs))
+        except CameraNotFound:
+            break  # no more cameras
+        index += 1
+    if not cams:
+        raise RuntimeError(f"No {kind} camera found.")
+    return cams
@@ -7,6 +7,9 @@ import time as tm
 import cv2 as cv
 import PySpin as ps
 
+from flir_camera_tools.frame_buffer import FrameBuffer
+from utils.tracing import tracer
+
 
 def bcode_read():
     """function to simplify collecting barcode information using a handheld barcode reader"""
@@ -28,9 +31,23 @@ def wl_to_ser(wl, device, status=None):
     device.write(bytes(ser_command, "UTF-8"))
 
 
-def get_save(cam, wl, device, barcode, delay=None):
+def get_save(cam, wl, device, barcode, delay=None, lighting=None):
     """a function to wait for some delay, turn on an illumination wavelength,
-    grab a frame from the camera, save the image and turn off the illumination"""
+    grab a frame from the camera, save the image and turn off the illumination.
+    If a LightingController is given as 'lighting' it switches the light and waits for
+    the firmware's acknowledgement instead of sleeping for 'delay'. 'cam' is a PySpin
+    camera here, which the controller cannot watch settle, so two frames are grabbed and
+    only the second, exposed entirely under the new light, is saved"""
+    if lighting is not None:
+        from utils.led_protocol import LED_ORDER, OFF, ON
+
+        states = {name: OFF for name in LED_ORDER}
+        states[str(wl)] = ON
+        lighting.apply(states, settle=False)
+        image, timestamps = grab_images(cam, n_frames=2)
+        save_avi(image[-1:], prefix=str(wl), barcode=barcode)
+        lighting.apply({name: OFF for name in LED_ORDER}, settle=False)
+        return
     if delay is None:
         delay = 5
     wl_to_ser(wl, device, status="on")
@@ -211,6 +228,25 @@ def set_acq_cont(cam):
         return False
 
 
+def set_buffer_handling(cam, mode="OldestFirst"):
+    """sets the stream buffer handling mode: "OldestFirst" queues every frame (nothing is
+    dropped), "NewestOnly" always hands back the most recent frame and drops older ones"""
+    try:
+        s_nodemap = cam.GetTLStreamNodeMap()
+        handling_mode = ps.CEnumerationPtr(s_nodemap.GetNode("StreamBufferHandlingMode"))
+        entry = handling_mode.GetEntryByName(mode)
+        handling_mode.SetIntValue(entry.GetValue())
+        return True
+    except ps.SpinnakerException as ex:
+        print("Error: %s" % ex)
+        return False
+
+
+def set_buffer_newest_only(cam):
+    """sets the stream buffer handling mode to NewestOnly"""
+    return set_buffer_handling(cam, "NewestOnly")
+
+
 def print_cam_info(cam):
     """prints variables pulled from the camera"""
     try:
@@ -263,10 +299,12 @@ def set_framerate(cam, frame_rate=None):
         return False
 
 
-def grab_images(cam, length=None, n_frames=None):
+def grab_images(cam, length=None, n_frames=None, buffer=None, preallocate=False):
     """this grabs a set of images from a camera.  It assumes the camera has been initialized and
     all desired changes to acquisition have been made on the camera. Expects 'length' to be in
-    seconds"""
+    seconds. With preallocate=True (or a FrameBuffer passed as 'buffer') each frame is copied
+    straight into a preallocated (n_frames, H, W) array instead of a list of separate arrays;
+    a ring FrameBuffer keeps the most recent frames of an open-ended grab"""
     if length is None and n_frames is None:
         n_frames = 1
     elif length is not None and n_frames is None:
@@ -278,6 +316,8 @@ def grab_images(cam, length=None, n_frames=None):
     elif length is not None and n_frames is not None:
         print("plese specify either the number of frames or the length of the acquisition not both")
         return
+    if buffer is not None or preallocate:
+        return grab_images_into(cam, n_frames, buffer)
     timestamps = []
     try:
         cam.BeginAcquisition()
@@ -285,8 +325,10 @@ def grab_images(cam, length=None, n_frames=None):
         timeout = 1000
         for _i in range(n_frames):
             curr_time = tm.time()
-            image = cam.GetNextImage(timeout)
-            images.append(image.GetNDArray())
+            with tracer.span("camera.GetNextImage"):
+                image = cam.GetNextImage(timeout)
+            with tracer.span("camera.GetNDArray"):
+                images.append(image.GetNDArray())
             image.Release()
             timestamps.append(curr_time)
         cam.EndAcquisition()
@@ -297,6 +339,36 @@ def grab_images(cam, length=None, n_frames=None):
         return False
 
 
+def grab_images_into(cam, n_frames, buffer=None):
+    """grabs n_frames into a FrameBuffer, copying each camera buffer directly into its slot.
+    If no buffer is given one is allocated for n_frames once the frame size is known.
+    Returns (frames, timestamps) as arrays, oldest first"""
+    if buffer is not None and not buffer.ring and buffer.capacity - buffer.count < n_frames:
+        raise ValueError(f"FrameBuffer has room for {buffer.capacity - buffer.count} frames, not {n_frames}")
+    try:
+        cam.BeginAcquisition()
+        try:
+            timeout = 1000
+            for _i in range(n_frames):
+                curr_time = tm.time()
+                with tracer.span("camera.GetNextImage"):
+                    image = cam.GetNextImage(timeout)
+                try:
+                    with tracer.span("camera.GetNDArray"):
+                        frame = image.GetNDArray()
+                        if buffer is None:
+                            buffer = FrameBuffer(n_frames, frame.shape, frame.dtype)
+                        buffer.put(frame, curr_time)
+                finally:
+                    image.Release()
+        finally:
+            cam.EndAcquisition()
+        return buffer.ordered()
+    except ps.SpinnakerException as ex:
+        print("Error: %s" % ex)
+        return False
+
+
 def save_avi(images, frame_rate=None, barcode=None, prefix=None, path=None, is_color=None):
     """OpenCV utility to save a video.  It expects 'images' to be a numpy array"""
     if frame_rate is None:
@@ -4,22 +4,39 @@ import time as tm
 import os
 import ctypes
 
-# --- 🔧 DLL + SDK setup for gxipy ---
+from flir_camera_tools.frame_buffer import FrameBuffer
+from utils.tracing import tracer
+
 gx_root = r"C:\Program Files\Daheng Imaging\GalaxySDK"
-dll_path = os.path.join(gx_root, "APIDll", "Win64")  # ← use Win64!
+gx = None  # gxipy, once load_sdk() has run
+
+
+def load_sdk():
+    """Sets up and imports gxipy on first use and returns it. On Windows the Galaxy SDK
+    DLL is preloaded first; raises if the SDK is missing, which only makes the Daheng
+    backend unavailable."""
+    global gx
+    if gx is not None:
+        return gx
+    if os.name == "nt":
+        # --- 🔧 DLL + SDK setup for gxipy ---
+        dll_path = os.path.join(gx_root, "APIDll", "Win64")  # ← use Win64!
 
-# Add to environment variables
-os.environ["GALAXY_SDK_ROOT"] = gx_root
-os.environ["GALAXY_GENICAM_ROOT"] = os.path.join(gx_root, "GenICam")
-os.environ["PATH"] = dll_path + os.pathsep + os.environ["PATH"]
+        # Add to environment variables
+        os.environ["GALAXY_SDK_ROOT"] = gx_root
+        os.environ["GALAXY_GENICAM_ROOT"] = os.path.join(gx_root, "GenICam")
+        os.environ["PATH"] = dll_path + os.pathsep + os.environ["PATH"]
 
-# ✅ Force preload GxIAPI.dll
-gx_dll = os.path.join(dll_path, "GxIAPI.dll")
-if not os.path.exists(gx_dll):
-    raise FileNotFoundError(f"❌ Could not find GxIAPI.dll at: {gx_dll}")
-ctypes.CDLL(gx_dll)
+        # ✅ Force preload GxIAPI.dll
+        gx_dll = os.path.join(dll_path, "GxIAPI.dll")
+        if not os.path.exists(gx_dll):
+            raise FileNotFoundError(f"❌ Could not find GxIAPI.dll at: {gx_dll}")
+        ctypes.CDLL(gx_dll)
 
-import gxipy as gx
+    import gxipy
+
+    gx = gxipy
+    return gx
 
 def bcode_read():
     bcode = input("Scan barcode now or press enter for no barcode ")
@@ -27,13 +44,13 @@ def bcode_read():
 
 
 def detect_cams(n=1):
-    device_manager = gx.DeviceManager()
+    device_manager = load_sdk().DeviceManager()
     device_manager.update_device_list()
     return len(device_manager.get_all_device_info()) >= n
 
 
 def init_cam():
-    device_manager = gx.DeviceManager()
+    device_manager = load_sdk().DeviceManager()
     device_manager.update_device_list()
     if len(device_manager.get_all_device_info()) == 0:
         raise RuntimeError("No Daheng cameras found.")
@@ -78,7 +95,36 @@ def set_acq_cont(cam):
     cam.AcquisitionMode.set("Continuous")
 
 
-def grab_images(cam, length=None, n_frames=None):
+def set_buffer_handling(cam, newest_only=False):
+    """sets the data stream's buffer handling mode (before stream_on): newest only, which
+    drops queued frames for the most recent one, or oldest first, which drops nothing.
+    Returns False if the SDK or camera does not offer the setting"""
+    modes = getattr(load_sdk(), "GxDSStreamBufferHandlingModeEntry", None)
+    newest, oldest = (modes.NEWEST_ONLY, modes.OLDEST_FIRST) if modes else (3, 1)
+    try:
+        cam.data_stream[0].StreamBufferHandlingMode.set(newest if newest_only else oldest)
+        return True
+    except Exception as ex:
+        print("Error: %s" % ex)
+        return False
+
+
+def bayer_pattern(cam):
+    """Returns the sensor's Bayer pattern ("BayerRG", "BayerGB", ...), or None for a
+    mono sensor."""
+    try:
+        value = cam.PixelColorFilter.get()
+    except Exception:
+        return None
+    symbol = value[1] if isinstance(value, tuple) else value  # enums come as (value, symbol)
+    return symbol if str(symbol).startswith("Bayer") else None
+
+
+def grab_images(cam, length=None, n_frames=None, buffer=None, preallocate=False, bayer=False):
+    """Grabs frames as RGB arrays. With bayer=True the raw sensor frames are kept
+    instead: nothing is demosaiced while frames arrive and each frame takes a third of
+    the memory. Convert them afterwards, in batches, with
+    frame_ops.demosaic(frames, bayer_pattern(cam))."""
     if length is None and n_frames is None:
         n_frames = 1
     elif length is not None and n_frames is None:
@@ -89,15 +135,32 @@ def grab_images(cam, length=None, n_frames=None):
         print("Specify only one of 'length' or 'n_frames'")
         return
 
+    if buffer is not None or preallocate:
+        # Copy every frame straight into a preallocated (n_frames, H, W, 3) FrameBuffer
+        for _ in range(n_frames):
+            with tracer.span("camera.get_image"):
+                raw = cam.data_stream[0].get_image(timeout=1000)
+            if raw is None:
+                continue
+            with tracer.span("camera.convert"):
+                img_np = (raw if bayer else raw.convert("RGB")).get_numpy_array()
+            if buffer is None:
+                buffer = FrameBuffer(n_frames, img_np.shape, img_np.dtype)
+            buffer.put(img_np, tm.time())
+        if buffer is None:
+            return [], []
+        return buffer.ordered()
+
     images = []
     timestamps = []
 
     for _ in range(n_frames):
-        raw = cam.data_stream[0].get_image(timeout=1000)
+        with tracer.span("camera.get_image"):
+            raw = cam.data_stream[0].get_image(timeout=1000)
         if raw is None:
             continue
-        rgb_image = raw.convert("RGB")
-        img_np = rgb_image.get_numpy_array()
+        with tracer.span("camera.convert"):
+            img_np = (raw if bayer else raw.convert("RGB")).get_numpy_array()
         images.append(img_np)
         timestamps.append(tm.time())
 
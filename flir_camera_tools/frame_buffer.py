@@ -0,0 +1,48 @@
+"""Preallocated frame storage for high frame rate grabs."""
+
+import numpy as np
+
+
+class FrameBuffer:
+    """One contiguous (n_frames, H, W[, C]) array plus a parallel array of timestamps,
+    allocated once up front so that grabbing a burst never touches the allocator.
+
+    Frames are copied straight from the camera buffer into their slot with put(). With
+    ring=True the buffer wraps around and keeps the most recent n_frames, which gives a
+    fixed memory footprint for open-ended runs."""
+
+    def __init__(self, n_frames, shape, dtype=np.uint8, ring=False):
+        self.frames = np.empty((n_frames, *shape), dtype=dtype)
+        self.timestamps = np.zeros(n_frames, dtype=np.float64)
+        self.ring = ring
+        self.count = 0  # frames put so far, including overwritten ones
+
+    @property
+    def capacity(self):
+        return len(self.frames)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def is_full(self):
+        return not self.ring and self.count >= self.capacity
+
+    def put(self, frame, timestamp=0.0):
+        """Copies 'frame' into the next slot and returns the slot index."""
+        if self.is_full():
+            raise IndexError("FrameBuffer is full")
+        i = self.count % self.capacity
+        np.copyto(self.frames[i], frame)
+        self.timestamps[i] = timestamp
+        self.count += 1
+        return i
+
+    def ordered(self):
+        """Returns (frames, timestamps) oldest first. This is a view unless a ring buffer
+        has wrapped, in which case the frames are reordered into a new array."""
+        n = len(self)
+        if self.count <= self.capacity:
+            return self.frames[:n], self.timestamps[:n]
+        start = self.count % self.capacity
+        order = np.r_[start:self.capacity, 0:start]
+        return self.frames[order], self.timestamps[order]
@@ -4,82 +4,151 @@ import sys
 import time
 import os
 import json
-import numpy as np
-import serial
-import cv2
+import threading
+START_TIME = time.perf_counter()  # for the time-to-window report
 #from picamera2 import Preview
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QPushButton, QLabel, QHBoxLayout, QVBoxLayout, QFrame, QGridLayout,
     QLineEdit, QFileDialog, QGroupBox, QButtonGroup, QRadioButton, QCheckBox, QComboBox
 )
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtGui import QImage, QPixmap
-import flir_camera_tools.cam_tools as ct
-import utils.cam_utils as cu
-import PySpin
+
+from utils.led_protocol import ARDUINO_BAUD
+
+# numpy, OpenCV and the camera SDKs are imported on first use (see init_camera and
+# start_acquisition), so the window shows before any of them has loaded.
 
 ARDUINO_PORT = "/dev/ttyACM0"
+CAMERA_BACKEND = os.environ.get("PHENOTYPEOMAT_CAMERA", "flir")  # "flir", "daheng" or "sim"
 USER_CONFIG_DIR = os.path.join(os.getcwd(), "users")
 os.makedirs(USER_CONFIG_DIR, exist_ok=True)
 
 
 
 class ArcardieGUI(QWidget):
+    # Emitted from the device workers, delivered on the GUI thread
+    camera_ready = pyqtSignal(object, str)
+    arduino_ready = pyqtSignal(bool)
+
     def __init__(self):
         super().__init__()
 
         self.init_window()
 
-        self.system = None
         self.cam = None
+        self.cams = []
+        self.rig = None
         self.dev = None
         self.image = None
         self.save_folder = os.path.join(os.path.expanduser('~'), 'Desktop')
         self.modified = False
-
-        self.init_camera()
-        self.init_serial()
-
+        self.exposure_cache = None
+        self.window_shown = False
+        self.cam_status = None  # None while connecting
+        self.arduino_status = None
+
+        self.preview = None  # created once the camera is open
+        self.preview_frame_id = 0
+        self.preview_buf = None  # keeps the array behind the shown QImage alive
+        self.preview_shown = 0
+        self.preview_skipped = 0
+        self.preview_last_shown = time.monotonic()
+        self.preview_fps = 0.0
         self.preview_timer = QTimer()
         self.preview_timer.timeout.connect(self.update_preview)
 
+        self.timelapse = None
+        self.timelapse_timer = QTimer()
+        self.timelapse_timer.timeout.connect(self.update_timelapse_status)
+
         self.init_ui()
+        self.camera_ready.connect(self.on_camera_ready)
+        self.arduino_ready.connect(self.on_arduino_ready)
+        # Devices connect in the background, once the window is up
+        QTimer.singleShot(0, self.init_camera)
+        QTimer.singleShot(0, self.init_serial)
 
     def init_window(self):
         self.setWindowTitle("Phenotype-o-mat GUI")
         self.setGeometry(100, 100, 400, 700)
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.window_shown:
+            self.window_shown = True
+            print(f"🪟 Window shown {(time.perf_counter() - START_TIME) * 1000:.0f} ms after start")
+
     def init_camera(self):
-        self.cam_status = False
-        if not ct.detect_cams():
-            sys.exit()
-        self.system = ct.ps.System.GetInstance()
-        cam_list = self.system.GetCameras()
-        self.cam = cam_list[0]
-        self.cam.Init()
-        self.cam_status = True
+        """Opens the cameras on a worker thread; on_camera_ready() takes over from there."""
+        def connect():
+            import flir_camera_tools.backends as cb
+            import utils.multi_cam, utils.preview  # load numpy/OpenCV here, not on the GUI thread
+
+            if CAMERA_BACKEND not in cb.available_backends():
+                self.camera_ready.emit([], f"{CAMERA_BACKEND} SDK not installed")
+                return
+            try:
+                self.camera_ready.emit(cb.open_cameras(CAMERA_BACKEND), "")
+            except Exception as e:
+                self.camera_ready.emit([], str(e))
+
+        threading.Thread(target=connect, name="camera-init", daemon=True).start()
+
+    def on_camera_ready(self, cams, error):
+        from utils.multi_cam import MultiCameraRig
+        from utils.preview import PreviewEngine
+
+        self.cam_status = bool(cams)
+        if not cams:
+            print(f"❌ Could not open {CAMERA_BACKEND} camera: {error}")
+            self.set_status(self.status_label, "Camera", "Unavailable", "red")
+            return
+        self.cams = cams
+        self.cam = self.cams[0]  # preview shows the first camera
+        # With several cameras, captures run on all of them in parallel.
+        self.rig = MultiCameraRig(self.cams) if len(self.cams) > 1 else None
+        self.preview = PreviewEngine(self.cam)
+        print(f"📷 {len(self.cams)} camera(s): {', '.join(str(c.serial) for c in self.cams)} "
+              f"ready {(time.perf_counter() - START_TIME) * 1000:.0f} ms after start")
+        self.set_status(self.status_label, "Camera", "Connected", "green")
+        self.preview_btn.setEnabled(True)
+        self.start_btn.setEnabled(True)
 
     def init_serial(self):
-        self.arduino_status = False
-        try:
-            self.dev = serial.Serial(ARDUINO_PORT, timeout=2)
-            time.sleep(2)
-            self.dev.write(b"SET LED_TRANS_STATUS 1;")
-            self.arduino_status = True
-        except:
-            self.dev = None
+        # The port is owned by the manager's I/O thread; the GUI only queues commands.
+        from utils.serial_manager import SerialManager
+
+        self.dev = SerialManager(ARDUINO_PORT, ARDUINO_BAUD)
+        threading.Thread(target=lambda: self.arduino_ready.emit(self.dev.start(wait=True)),
+                         name="arduino-init", daemon=True).start()
+        self.dev.write(b"SET LED_TRANS_STATUS 1;")
+
+    def on_arduino_ready(self, connected):
+        self.arduino_status = connected
+        self.set_status(self.arduino_label, "Arduino", "Connected" if connected else "Disconnected",
+                        "green" if connected else "red")
+        print(f"🔌 Arduino {'connected' if connected else 'not connected'} "
+              f"{(time.perf_counter() - START_TIME) * 1000:.0f} ms after start")
+
+    @staticmethod
+    def set_status(label, device, text, color):
+        label.setText(f"{device}: {text}")
+        label.setStyleSheet(f"color: {color}; font-weight: bold;")
 
     def init_ui(self):
         main_layout = QHBoxLayout(self)
         layout = QVBoxLayout()
         main_layout.addLayout(layout)
         # Status
-        self.status_label = QLabel("Camera: " + ("Connected" if self.cam_status else "Disconnected"))
-        self.status_label.setStyleSheet(f"color: {'green' if self.cam_status else 'red'}; font-weight: bold;")
-        self.arduino_label = QLabel("Arduino: " + ("Connected" if self.arduino_status else "Disconnected"))
-        self.arduino_label.setStyleSheet(f"color: {'green' if self.arduino_status else 'red'}; font-weight: bold;")
+        self.status_label = QLabel()
+        self.set_status(self.status_label, "Camera", "Connecting...", "orange")
+        self.arduino_label = QLabel()
+        self.set_status(self.arduino_label, "Arduino", "Connecting...", "orange")
         layout.addWidget(self.status_label)
         layout.addWidget(self.arduino_label)
+        self.preview_stats_label = QLabel("")
+        layout.addWidget(self.preview_stats_label)
 
         # Toggle preview
         self.preview_label = QLabel("Live Preview")
@@ -89,6 +158,7 @@ class ArcardieGUI(QWidget):
 
         self.preview_btn = QPushButton("Start Preview")
         self.preview_btn.clicked.connect(self.toggle_preview)
+        self.preview_btn.setEnabled(False)  # until the camera is open
         layout.addWidget(self.preview_btn)
 
         # User selection
@@ -128,7 +198,7 @@ class ArcardieGUI(QWidget):
         self.duration_input = QLineEdit()
         #self.res_x.setPlaceholderText("Width [8 - 1440]")
         #self.res_y.setPlaceholderText("Height [6 - 1080]")
-        self.expo_input.setPlaceholderText("Exposure (μs)")
+        self.expo_input.setPlaceholderText("Exposure (μs, or auto)")
         self.framerate_input.setPlaceholderText("Interval (min between frames)")
         self.duration_input.setPlaceholderText("Duration (min, for video/timelapse)")
         # Track changes to mark as modified
@@ -186,51 +256,126 @@ class ArcardieGUI(QWidget):
         layout.addWidget(self.path_display)
 
         layout.addWidget(self.make_divider())
-        start_btn = QPushButton("Start")
-        layout.addWidget(start_btn)
-        start_btn.clicked.connect(self.start_acquisition)
+        self.start_btn = QPushButton("Start")
+        layout.addWidget(self.start_btn)
+        self.start_btn.clicked.connect(self.start_acquisition)
+        self.start_btn.setEnabled(False)  # until the camera is open
+
+        run_layout = QHBoxLayout()
+        self.pause_btn = QPushButton("Pause")
+        self.pause_btn.clicked.connect(self.toggle_pause_timelapse)
+        self.cancel_btn = QPushButton("Stop")
+        self.cancel_btn.clicked.connect(self.cancel_timelapse)
+        self.pause_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(False)
+        run_layout.addWidget(self.pause_btn)
+        run_layout.addWidget(self.cancel_btn)
+        layout.addLayout(run_layout)
+        self.run_status = QLabel("")
+        layout.addWidget(self.run_status)
 
         self.setLayout(layout)
         self.update_field_states()
 
     def toggle_preview(self):
+        if self.timelapse_running():
+            print("⚠️ Preview unavailable while a timelapse is running.")
+            return
         if self.preview_timer.isActive():
-            self.preview_timer.stop()
-            self.preview_btn.setText("Start Preview")
-            print("Preview stopped.")
-            if self.dev:
-                self.dev.write(b"SET LED_TRANS_STATUS 1;")  
+            self.stop_preview()
         else:
-            self.preview_timer.start(100)  # every 100 ms
+            self.preview.size = (self.preview_label.width(), self.preview_label.height())
+            self.preview.start()
+            self.preview_timer.start(30)  # GUI refresh; frames arrive at the camera's own rate
             self.preview_btn.setText("Stop Preview")
             print("Preview started.")
             if self.dev:
                 self.dev.write(b"SET LED_TRANS_STATUS 0;")
 
-    def update_preview(self):
-        if self.cam:
-            try:
-                self.cam.BeginAcquisition()
-                img = self.cam.GetNextImage()
-                if img.IsIncomplete():
-                    return
-                np_img = img.GetNDArray()
-                img.Release()
-                self.cam.EndAcquisition()
-
-                h, w = np_img.shape
-                qimg = QImage(np_img.data, w, h, QImage.Format_Grayscale8)
-                pixmap = QPixmap.fromImage(qimg)
-                self.preview_label.setPixmap(
-                    pixmap.scaled(
-                        self.preview_label.size(),
-                        Qt.KeepAspectRatio,
-                        Qt.SmoothTransformation  # <- adds better scaling quality
-                    )
-                )
-            except PySpin.SpinnakerException as e:
-                print("Preview error:", e)
+    def stop_preview(self):
+        self.preview_timer.stop()
+        self.preview.stop()
+        self.preview_stats_label.setText("")
+        self.preview_btn.setText("Start Preview")
+        print("Preview stopped.")
+        if self.dev:
+            self.dev.write(b"SET LED_TRANS_STATUS 1;")
 
+    def update_preview(self):
+        frame_id, np_img = self.preview.latest(self.preview_frame_id)
+        if np_img is None:
+            return
+        if self.preview_frame_id and frame_id - self.preview_frame_id > 1:
+            self.preview_skipped += frame_id - self.preview_frame_id - 1
+        self.preview_frame_id = frame_id
+
+        # The frame is already decimated to the label size and C-contiguous on the
+        # preview thread, so it is wrapped as-is: no scaling or conversion here.
+        self.preview_buf = np_img
+        h, w = np_img.shape[:2]
+        fmt = QImage.Format_RGB888 if np_img.ndim == 3 else QImage.Format_Grayscale8
+        qimg = QImage(np_img.data, w, h, np_img.strides[0], fmt)
+        self.preview_label.setPixmap(QPixmap.fromImage(qimg))
+
+        now = time.monotonic()
+        self.preview_fps = 0.9 * self.preview_fps + 0.1 / max(now - self.preview_last_shown, 1e-6)
+        self.preview_last_shown = now
+        self.preview_shown += 1
+        if self.preview_shown % 10 == 0:
+            self.preview_stats_label.setText(
+                f"Preview: {self.preview_fps:.1f} fps (camera {self.preview.fps:.1f}), "
+                f"render {self.preview.render_ms:.1f} ms, skipped {self.preview_skipped}"
+            )
+
+    def timelapse_running(self):
+        return self.timelapse is not None and self.timelapse.is_running()
+
+    def toggle_pause_timelapse(self):
+        if not self.timelapse_running():
+            return
+        if self.timelapse.progress()["paused"]:
+            self.timelapse.resume()
+            self.pause_btn.setText("Pause")
+        else:
+            self.timelapse.pause()
+            self.pause_btn.setText("Resume")
+
+    def cancel_timelapse(self):
+        if self.timelapse_running():
+            self.timelapse.cancel()
+
+    def update_timelapse_status(self):
+        p = self.timelapse.progress()
+        if p["finished"]:
+            self.timelapse_timer.stop()
+            self.start_btn.setEnabled(True)
+            self.user_selector.setEnabled(True)
+            self.pause_btn.setEnabled(False)
+            self.pause_btn.setText("Pause")
+            self.cancel_btn.setEnabled(False)
+            state = "cancelled" if p["cancelled"] else "done"
+            self.run_status.setText(f"Timelapse {state}: {p['frame']}/{p['total']} frames")
+            return
+        eta = p["eta_sec"] or 0
+        state = " (paused)" if p["paused"] else ""
+        self.run_status.setText(
+            f"Timelapse: {p['frame']}/{p['total']} frames, ETA {int(eta // 3600)}h "
+            f"{int(eta % 3600 // 60):02d}m{state}"
+        )
+
+    def closeEvent(self, event):
+        if self.preview:
+            self.preview.stop()
+        if self.timelapse_running():
+            self.timelapse.cancel()
+            self.timelapse.join()
+        if self.rig:
+            self.rig.close()
+        for cam in self.cams:
+            cam.close()
+        if self.dev:
+            self.dev.stop()
+        super().closeEvent(event)
 
     def browse_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Select Output Directory", self.save_folder)
@@ -271,6 +416,18 @@ class ArcardieGUI(QWidget):
                 self.yellow_cb.setChecked(colors.get("yellow", False))
                 self.green_cb.setChecked(colors.get("green", False))
 
+                # Camera settings saved with this user, applied as a diff
+                from utils.camera_profile import CameraProfile, list_profiles
+
+                if self.timelapse_running():
+                    print("⚠️ Camera profile not applied while a timelapse is running.")
+                elif self.cam and name in list_profiles():
+                    if self.preview.is_running():
+                        self.stop_preview()  # size changes need the stream stopped
+                    profile = CameraProfile.load(name)
+                    for cam in self.cams:
+                        profile.apply(cam)
+
                 # Output directory
                 self.save_folder = cfg.get("save_folder", self.save_folder)
                 self.path_display.setText(f"Save Path: {self.save_folder}")
@@ -303,6 +460,10 @@ class ArcardieGUI(QWidget):
         }
         with open(os.path.join(USER_CONFIG_DIR, f"{name}.json"), "w") as f:
             json.dump(config, f, indent=2)
+        if self.cam:
+            from utils.camera_profile import CameraProfile
+
+            CameraProfile.snapshot(self.cam, name).save()  # users/profiles/<name>.json
 
         self.modified = False
         self.load_users()
@@ -328,6 +489,13 @@ class ArcardieGUI(QWidget):
         if not self.cam:
             print("❌ No camera initialized.")
             return
+        if self.timelapse_running():
+            print("⚠️ A timelapse is already running.")
+            return
+        if self.preview.is_running():
+            self.stop_preview()  # the capture needs the acquisition stream to itself
+        import utils.cam_utils as cu
+        from utils.multi_cam import run_single_image_multi, run_timelapse_multi, run_video_multi
 
         mode_id = self.mode_buttons.checkedId()
         mode_map = {0: "single", 1: "timelapse", 2: "video"}
@@ -347,20 +515,28 @@ class ArcardieGUI(QWidget):
             print("❌ Invalid resolution input")
             return
         """
-        width = self.cam.Width.GetValue()
-        height = self.cam.Height.GetValue()
+        width, height = self.cam.resolution()
         print(f"📷 Camera actual resolution: {width} x {height}")
         # --- Parse Exposure ---
-        try:
-            exposure = int(self.expo_input.text())
-            if cu.set_exposure(self.cam, exposure):
+        # "auto" takes the exposure from the calibration cache (metering only on a miss)
+        auto_exposure = self.expo_input.text().strip().lower() == "auto"
+        if auto_exposure and self.exposure_cache is None:
+            from utils.exposure_cache import ExposureCache
+
+            self.exposure_cache = ExposureCache()
+        if auto_exposure and (mode != "timelapse" or self.rig):
+            print("ℹ️ Auto exposure is only available for single-camera timelapses; keeping the current exposure.")
+        elif not auto_exposure:
+            try:
+                exposure = int(self.expo_input.text())
+            except ValueError:
+                print("❌ Invalid exposure input")
+                return
+            if self.apply_settings(ExposureAuto="Off", ExposureTime=exposure):
                 print(f"✅ Exposure set to {exposure} μs")
             else:
                 print("❌ Failed to set exposure")
                 return
-        except ValueError:
-            print("❌ Invalid exposure input")
-            return
 
         # --- Parse Duration ---
         try:
@@ -375,7 +551,7 @@ class ArcardieGUI(QWidget):
                 interval_min = float(self.framerate_input.text())
                 fps = 1 / (interval_min * 60)
                 if fps >= 1.0:
-                    if cu.set_framerate(self.cam, fps):
+                    if self.apply_settings(AcquisitionFrameRateEnable=True, AcquisitionFrameRate=fps):
                         print(f"✅ Camera framerate set to {fps:.2f} Hz")
                     else:
                         print("⚠️ Failed to set framerate (might be out of bounds)")
@@ -392,7 +568,10 @@ class ArcardieGUI(QWidget):
         # --- Run Mode-Specific Capture ---
         print(f"🚀 Starting mode: {mode}")
         if mode == "single":
-            cu.run_single_image(self.cam, self.save_folder, prefix, barcode)
+            if self.rig:
+                run_single_image_multi(self.rig, self.save_folder, prefix, barcode)
+            else:
+                cu.run_single_image(self.cam, self.save_folder, prefix, barcode)
 
         elif mode == "timelapse":
             colors = {
@@ -401,22 +580,56 @@ class ArcardieGUI(QWidget):
                 "590": self.yellow_cb.isChecked(),
                 "535": self.green_cb.isChecked()
             }
-            cu.run_timelapse(self.cam, duration_min, interval_min, self.save_folder, prefix, barcode, self.dev, colors)
+            # Runs on its own thread; the GUI only polls its progress.
+            if self.rig:
+                self.timelapse = run_timelapse_multi(self.rig, duration_min, interval_min, self.save_folder, prefix,
+                                                     barcode, self.dev, colors, background=True)
+            else:
+                self.timelapse = cu.run_timelapse(self.cam, duration_min, interval_min, self.save_folder, prefix,
+                                                  barcode, self.dev, colors, background=True,
+                                                  exposure_cache=self.exposure_cache if auto_exposure else None)
+            self.start_btn.setEnabled(False)
+            self.user_selector.setEnabled(False)  # a user's profile would reconfigure the camera mid-run
+            self.pause_btn.setEnabled(True)
+            self.cancel_btn.setEnabled(True)
+            self.timelapse_timer.start(1000)
         elif mode == "video":
-            cu.run_video(self.cam, duration_min * 60, self.save_folder, prefix, barcode, fps=30)
+            if self.rig:
+                run_video_multi(self.rig, duration_min * 60, self.save_folder, prefix, barcode, fps=30)
+            else:
+                cu.run_video(self.cam, duration_min * 60, self.save_folder, prefix, barcode, fps=30)
+
+    def apply_settings(self, **values):
+        """Sets camera nodes on every camera, writing only those that actually change."""
+        from utils.camera_profile import CameraProfile
+
+        ok = True
+        for cam in self.cams:
+            current = CameraProfile.snapshot(cam)
+            # not every camera has a frame-rate enable switch
+            target = {k: v for k, v in values.items() if k != "AcquisitionFrameRateEnable" or k in current.values}
+            ok &= current.updated(**target).apply(cam, current) is not None
+        return ok
 
     def send_led_command(self, color, state):
-        if not self.dev or not self.arduino_status:
+        if not self.dev or not self.dev.connected:
             print(f"⚠️ Cannot send LED command for {color}: Arduino not connected.")
             return
 
         status = 1 if state == Qt.Checked else 0
         cmd = f"SET LED_{color}_STATUS {status};"
-        try:
-            self.dev.write(cmd.encode())
-            print(f"📤 Sent to Arduino: {cmd}")
-        except Exception as e:
-            print(f"❌ Failed to send command to Arduino: {e}")
+        reply = self.dev.request(cmd)
+        print(f"📤 Sent to Arduino: {cmd}")
+
+        def report(f):
+            if f.exception() is not None:
+                print(f"❌ Failed to send command to Arduino: {f.exception()}")
+            elif f.result() is None:
+                print(f"⚠️ No reply from Arduino to {cmd}")
+            else:
+                print(f"📥 Arduino: {f.result()[0]} = {f.result()[1]:g}")
+
+        reply.add_done_callback(report)
 
 
 
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""Headless acquisition: runs protocol files without the GUI (no Qt needed).
+
+    python run_protocol.py protocols/example_timelapse.json other.json
+    python run_protocol.py --queue /data/queue      # run protocols as they are dropped in
+
+The camera and Arduino are opened once and kept open across all protocols. In queue
+mode *.json files in the directory are run oldest first and moved to done/ (or failed/)
+afterwards; the runner keeps waiting for new files until interrupted with Ctrl-C. A file
+is only picked up once it has not changed for a full polling interval, so one still
+being copied in is never read half-written.
+
+A protocol is a JSON object with a list of steps, run in order:
+
+    {"name": "overnight", "output": "/data/overnight", "barcode": "000123",
+     "steps": [
+        {"lights": {"TRANS": true}},
+        {"exposure": 2000},                          (μs, or "auto")
+        {"profile": "Aparna"},                       (users/profiles/Aparna.json)
+        {"settings": {"Gain": 6.0}},
+        {"capture": "single", "prefix": "before"},
+        {"capture": "timelapse", "duration_min": 600, "interval_min": 10, "colors": ["460"]},
+        {"capture": "video", "duration_sec": 10},
+        {"capture": "sequence", "wavelengths": ["460", "670"], "exposures": {"670": 8000}},
+        {"wait": 30},
+        {"repeat": 3, "steps": [...]}
+     ]}
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time as tm
+
+import flir_camera_tools.backends as cb
+from utils.led_protocol import ARDUINO_BAUD
+from utils.protocol import ProtocolRunner, load_protocol
+
+
+def run_file(runner, filepath):
+    """Loads and runs one protocol file; returns False if it failed."""
+    try:
+        runner.run(load_protocol(filepath))
+        return True
+    except Exception as e:
+        print(f"❌ Protocol {filepath} failed: {e}")
+        return False
+
+
+def run_queue(runner, directory, poll_s):
+    for sub in ("done", "failed"):
+        os.makedirs(os.path.join(directory, sub), exist_ok=True)
+    print(f"📥 Watching {directory} for protocols (Ctrl-C to stop)")
+    while True:
+        settled = tm.time() - poll_s  # files modified since then may still be being written
+        pending = sorted((os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".json")
+                          and os.path.getmtime(os.path.join(directory, f)) < settled), key=os.path.getmtime)
+        if not pending:
+            tm.sleep(poll_s)
+            continue
+        filepath = pending[0]
+        ok = run_file(runner, filepath)
+        shutil.move(filepath, os.path.join(directory, "done" if ok else "failed", os.path.basename(filepath)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("protocols", nargs="*", help="protocol files, run back to back")
+    parser.add_argument("--queue", help="directory to take protocol files from as they arrive")
+    parser.add_argument("--poll", type=float, default=5.0, help="queue polling interval (s)")
+    parser.add_argument("--camera", default=os.environ.get("PHENOTYPEOMAT_CAMERA", "flir"), choices=list(cb.BACKENDS))
+    parser.add_argument("--port", default="/dev/ttyACM0", help="Arduino serial port")
+    parser.add_argument("--baud", type=int, default=ARDUINO_BAUD)
+    parser.add_argument("--no-arduino", action="store_true", help="run without LED control")
+    parser.add_argument("--output", default=".", help="default output directory")
+    args = parser.parse_args()
+    if not args.protocols and not args.queue:
+        parser.error("give protocol files and/or --queue")
+
+    sys.stdout.reconfigure(line_buffering=True)  # keep logs current when redirected to a file
+
+    # Check every file up front, so a typo fails now rather than hours into the run
+    for filepath in args.protocols:
+        try:
+            load_protocol(filepath)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+
+    cam = cb.open_camera(args.camera)
+    dev = None
+    if not args.no_arduino:
+        from utils.serial_manager import SerialManager
+
+        dev = SerialManager(args.port, args.baud)
+        if not dev.start(wait=True):
+            print(f"⚠️ Arduino not connected on {args.port}; it will keep retrying in the background.")
+    runner = ProtocolRunner(cam, dev, args.output)
+    failed = 0
+    try:
+        for filepath in args.protocols:
+            failed += not run_file(runner, filepath)
+        if args.queue:
+            run_queue(runner, args.queue, args.poll)
+    except KeyboardInterrupt:
+        print("🛑 Interrupted")
+    finally:
+        if cam.is_streaming:
+            cam.stop()
+        cam.close()
+        if dev is not None:
+            dev.stop()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
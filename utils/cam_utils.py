@@ -1,8 +1,25 @@
 import time as tm
 from datetime import datetime
 import os
+import queue
+import threading
 import cv2
-import PySpin as ps
+
+try:
+    import PySpin as ps  # only needed by the FLIR node helpers below
+except ImportError:
+    ps = None
+
+from utils.delta_store import DeltaWriter
+from utils.image_writer import ImageWriterPool
+from utils.led_protocol import led_states
+from utils.lighting import LightingController
+from utils.metrics import MetricsWorker
+from utils.raw_store import RawFrameWriter
+from utils.roi import RoiSaver, resolve_grid
+from utils.scheduler import AdaptiveInterval, TimelapseScheduler
+from utils.stack_store import StackWriter
+from utils.tracing import tracer
 
 def get_resolution_range(cam):
     try:
@@ -76,77 +93,191 @@ def save_avi(images, frame_rate=30.0, barcode="000000", prefix="capture", path="
 
 
 
-def run_single_image(cam, output_dir, prefix="single", barcode="000000"):
-    """Capture and save a single image."""
-    cam.BeginAcquisition()
-    img = cam.GetNextImage(1000)
-    if img.IsIncomplete():
+def run_single_image(cam, output_dir, prefix="single", barcode="000000", writer=None):
+    """Capture and save a single image.
+
+    The frame is encoded by 'writer' (an ImageWriterPool) if one is given, otherwise by
+    a PNG pool that is flushed before returning."""
+    with tracer.span("single.grab"):
+        np_img, _ = grab_image(cam)
+    if np_img is None:
         print("⚠️ Image incomplete. Skipping.")
-        cam.EndAcquisition()
         return
-    np_img = img.GetNDArray()
-    img.Release()
-    cam.EndAcquisition()
 
     timestamp = int(tm.time())
-    filename = f"{prefix}_{barcode}_{timestamp}.png"
-    filepath = os.path.join(output_dir, filename)
-    cv2.imwrite(filepath, np_img)
-    print(f"✅ Single image saved: {filepath}")
-
-
-def grab_image(cam):
+    filepath = os.path.join(output_dir, f"{prefix}_{barcode}_{timestamp}")
+    with tracer.span("single.save"):
+        if writer is None:
+            with ImageWriterPool(workers=1) as pool:
+                pool.submit(np_img, filepath, {"timestamp": timestamp})
+        else:
+            writer.submit(np_img, filepath, {"timestamp": timestamp})
+    print(f"✅ Single image captured: {filepath}")
+
+
+def grab_image(cam, timeout_ms=1000):
+    """Starts the stream, grabs one frame and stops again. Returns (frame, timestamp);
+    frame is None if the grab timed out or was incomplete."""
+    with tracer.span("camera.start"):
+        cam.start()
     try:
-        cam.BeginAcquisition()
-        timeout = 1000
-        timestamp = tm.time()
-        image = cam.GetNextImage(timeout)
-        image.Release()
-        cam.EndAcquisition()
-        return image, timestamp
-    except ps.SpinnakerException as ex:
-        cam.EndAcquisition()
-        print("Error: %s" % ex)
-        return False
-
-def run_timelapse(cam, duration_min, interval_min, path, prefix, barcode, dev, colors):
+        return cam.get_frame(timeout_ms)
+    finally:
+        with tracer.span("camera.stop"):
+            cam.stop()
+
+
+def run_timelapse(cam, duration_min, interval_min, path, prefix, barcode, dev, colors, background=False,
+                  fmt="png", compression=3, lighting=None, roi=None, overview_factor=None,
+                  analyze=False, threshold=None, change_threshold=None, keyframe_every=30, lossless=True,
+                  adaptive=None, exposure_cache=None):
+    """Capture a timelapse, firing every frame at start + i * interval on the monotonic clock.
+
+    With background=True the run happens on its own thread and the TimelapseScheduler is
+    returned straight away so the caller can pause, cancel or poll progress(); otherwise
+    this blocks until the last frame. The per-frame schedule jitter is saved next to the
+    images as {prefix}_{barcode}_schedule.csv.
+
+    Frames are saved by a background ImageWriterPool in 'fmt' ("png" or "tiff") at the
+    given 'compression', so encoding never holds the lights in their capture state.
+    Encode latency per file goes to {prefix}_{barcode}_writes.jsonl. With fmt="stack"
+    all frames go into one chunked, compressed {prefix}_{barcode}_{start}.pstack file
+    (zlib level 'compression') indexed by timestamp and LED state; see stack_store.
+
+    With 'change_threshold' set, frames that changed less than that (fraction of full
+    scale) since the last keyframe are stored as a delta to it, or with lossless=False
+    not at all, and a full keyframe is forced every 'keyframe_every' frames; see
+    delta_store.DeltaWriter, whose DeltaReader rebuilds the frames. PNG/TIFF
+    whole frames only (not with fmt="stack" or 'roi').
+
+    With 'roi' set only the wells are kept: every frame is cut into per-well crops at
+    ingest (see roi.RoiSaver), plus a full frame decimated by 'overview_factor' if given.
+    'roi' is a WellGrid, a grid template file, or a plate size (e.g. 24) to detect the
+    grid on the first frame.
+
+    With analyze=True every frame (and every well, with 'roi') is measured on a background
+    thread while the run continues, and the results are appended to
+    {prefix}_{barcode}_metrics.csv as they come in (see metrics.MetricsWorker).
+
+    With 'adaptive' (an AdaptiveInterval, or a (min_min, max_min) pair of intervals in
+    minutes) the interval follows the activity in the scene, starting at 'interval_min':
+    shorter while frames change, longer while the scene is static. Each frame's measured
+    activity and the interval chosen after it are added to the _schedule.csv log.
+
+    With an 'exposure_cache' (exposure_cache.ExposureCache) the exposure is taken from
+    the cache for the capture light state on the first frame, and metered only if the
+    cache has no fresh entry for this camera and light combination.
+
+    Each frame waits only until the firmware acknowledges the new light state and the
+    image brightness has settled (see LightingController), not for a fixed delay.
+
+    With tracing enabled (utils.tracing) the per-stage timings are summarized at the end
+    and saved as {prefix}_{barcode}_trace.json."""
 
     total_frames = int(duration_min / interval_min)
     print(f"⏱️ Capturing {total_frames} frames, every {interval_min} minutes")
-
-    set_color_leds(dev, colors, on=False)
-    set_led_bed(dev, on=False)
-
-    for i in range(total_frames):
-        print(f"📸 Capturing frame {i+1}/{total_frames}")
-
-        # Switch lights
-        set_color_leds(dev, colors, on=False)
-        set_led_bed(dev, on=True)
-        tm.sleep(5)  # small delay for lighting to stabilize
-
-        # Capture
-        cam.BeginAcquisition()
-        img = cam.GetNextImage()
-        np_img = img.GetNDArray()
-        img.Release()
-        cam.EndAcquisition()
-
-        # Save
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(path, f"{prefix}_{barcode}_{ts}.png")
-        cv2.imwrite(filename, np_img)
-        print(f"💾 Saved: {filename}")
+    tracer.reset()  # the saved trace covers this run only
+
+    if lighting is None:
+        lighting = LightingController(dev, cam)
+    lighting.apply(led_states(False, colors, colors_on=False), settle=False)
+
+    if fmt == "stack":
+        start_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # at most a minute of frames is ever held only in memory
+        writer = StackWriter(os.path.join(path, f"{prefix}_{barcode}_{start_ts}.pstack"), level=compression,
+                             flush_every_s=60)
+    else:
+        writer = ImageWriterPool(fmt, compression,
+                                 index_path=os.path.join(path, f"{prefix}_{barcode}_writes.jsonl"))
+    # LED state while a frame is taken: bed on, selected colors off
+    capture_leds = {"TRANS": True, **{wl: False for wl, enabled in colors.items() if enabled}}
+    if adaptive is not None and not isinstance(adaptive, AdaptiveInterval):
+        adaptive = AdaptiveInterval(adaptive[0] * 60, adaptive[1] * 60, start_sec=interval_min * 60)
+    rois = None
+    metrics = None
+    deltas = None
+    if change_threshold is not None and fmt != "stack" and roi is None:
+        deltas = DeltaWriter(path, prefix, barcode, writer, change_threshold, keyframe_every, lossless)
+
+    def save_frame(np_img, i):
+        nonlocal rois
+        if roi is not None:
+            if rois is None:
+                rois = RoiSaver(resolve_grid(roi, np_img), path, prefix, barcode, writer, overview_factor)
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            rois.save(np_img, tm.time(), ts, {"frame": i, "timestamp": ts, "leds": capture_leds})
+        elif deltas is not None:
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            deltas.append(np_img, i, ts, {"frame": i, "timestamp": ts, "leds": capture_leds})
+        elif fmt == "stack":
+            writer.append(np_img, tm.time(), capture_leds)
+        else:
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = os.path.join(path, f"{prefix}_{barcode}_{ts}")
+            writer.submit(np_img, filename, {"frame": i, "timestamp": ts, "leds": capture_leds})
+
+    def capture_frame(i):
+        nonlocal metrics
+        print(f"📸 Capturing frame {i+1}/{scheduler.n_frames}")
+
+        # Switch lights, wait for the firmware's ack and for the image to settle, then capture
+        with tracer.span("camera.start"):
+            cam.start(newest_only=True)
+        try:
+            with tracer.span("timelapse.lights"):
+                lighting.apply(led_states(True, colors, colors_on=False))
+            if exposure_cache is not None and i == 0:
+                exposure_cache.exposure_for(cam, led_states(True, colors, colors_on=False))
+            with tracer.span("timelapse.get_frame"):
+                np_img, _ = cam.get_frame(5000)
+        finally:
+            with tracer.span("camera.stop"):
+                cam.stop()
+        if np_img is None:
+            print(f"⚠️ Frame {i+1} incomplete. Skipping.")
+            lighting.apply(led_states(True, colors, colors_on=True), settle=False)
+            return
+
+        # Save (encoded in the background)
+        with tracer.span("timelapse.save"):
+            save_frame(np_img, i)
+
+        if adaptive is not None:
+            adaptive.update(i, np_img)
+        if analyze:
+            if metrics is None:
+                metrics = MetricsWorker(os.path.join(path, f"{prefix}_{barcode}_metrics.csv"),
+                                        rois.grid if rois is not None else None, threshold)
+            metrics.submit(np_img, i, tm.time())
 
         # Restore lights
-        #set_led_bed(dev, on=False)
-        set_color_leds(dev, colors, on=True)
-
-        if i < total_frames - 1:
-            tm.sleep(interval_min * 60)  # wait until next frame
-
-    set_led_bed(dev, on=False)
-    set_color_leds(dev, colors, on=False)
+        with tracer.span("timelapse.restore_lights"):
+            lighting.apply(led_states(True, colors, colors_on=True), settle=False)
+
+    def finish():
+        lighting.apply(led_states(False, colors, colors_on=False), settle=False)
+        try:
+            writer.close()  # raises if frames were lost
+        finally:
+            if rois is not None:
+                rois.close()
+            if metrics is not None:
+                metrics.close()
+            if deltas is not None:
+                deltas.close()
+            if adaptive is not None:
+                for row in scheduler.log:
+                    row.update(adaptive.decisions.get(row["frame"], {}))
+            scheduler.write_log(os.path.join(path, f"{prefix}_{barcode}_schedule.csv"))
+            tracer.dump(os.path.join(path, f"{prefix}_{barcode}_trace.json"))
+
+    scheduler = TimelapseScheduler(capture_frame, total_frames, interval_min * 60, on_finish=finish,
+                                   next_interval=adaptive, duration_sec=duration_min * 60 if adaptive else None)
+    if background:
+        return scheduler.start()
+    scheduler.run()
+    return scheduler
 
 def set_led_bed(dev, on: bool):
     try:
@@ -165,38 +296,142 @@ def set_color_leds(dev, colors: dict, on: bool):
     except Exception as e:
         print("Error setting color LEDs:", e)
 
-def run_video(cam, duration_sec, output_dir, prefix="video", barcode="000000", fps=30.0):
-    """Capture a continuous stream and save it as a .avi video."""
-    print(f"🎥 Starting video recording for {duration_sec} seconds")
-
-    cam.BeginAcquisition()
+def run_video(cam, duration_sec, output_dir, prefix="video", barcode="000000", fps=30.0, queue_size=64,
+              container="avi"):
+    """Capture a continuous stream and save it as a .avi video.
 
-    images = []
-    timestamps = []
+    Frames are streamed to disk while recording: this thread grabs frames into a
+    bounded queue and a writer thread encodes them as they arrive, so memory use
+    stays flat however long the recording runs. If the writer falls behind and the
+    queue is full, new frames are dropped and counted rather than buffered.
 
-    start_time = tm.time()
-    while tm.time() - start_time < duration_sec:
-        img = cam.GetNextImage(1000)
-        if img.IsIncomplete():
-            print("⚠️ Skipped incomplete frame.")
-            continue
-        np_img = img.GetNDArray()
-        images.append(np_img)
-        timestamps.append(tm.time())
-        img.Release()
+    With container="raw" nothing is encoded: frames go straight into a memory-mapped
+    .praw file (see run_raw_video), for bursts faster than the AVI writer can keep up with.
+    With tracing enabled (utils.tracing) the stage timings are saved next to the video as
+    a _trace.json file."""
+    if container == "raw":
+        return run_raw_video(cam, duration_sec, output_dir, prefix, barcode)
 
-    cam.EndAcquisition()
-
-    if not images:
-        print("❌ No frames captured.")
-        return
+    print(f"🎥 Starting video recording for {duration_sec} seconds")
+    tracer.reset()  # the saved trace covers this run only
 
-    h, w = images[0].shape
     filename = f"{prefix}_{barcode}_{int(tm.time())}.avi"
     filepath = os.path.join(output_dir, filename)
 
-    writer = cv2.VideoWriter(filepath, 0, fps, (w, h), False)
-    for frame in images:
-        writer.write(frame)
-    writer.release()
-    print(f"💾 Video saved: {filepath}")
\ No newline at end of file
+    frames = queue.Queue(maxsize=queue_size)
+    stats = {"captured": 0, "written": 0, "dropped": 0, "incomplete": 0, "queue_high_water": 0}
+    errors = []  # an error in the writer thread, re-raised by the recording loop
+
+    def write_frames():
+        writer = None
+        try:
+            while True:
+                frame = frames.get()
+                if frame is None:
+                    break
+                if writer is None:
+                    h, w = frame.shape[:2]
+                    writer = cv2.VideoWriter(filepath, 0, fps, (w, h), frame.ndim == 3)
+                    if not writer.isOpened():
+                        raise IOError(f"Could not open {filepath} for writing")
+                with tracer.span("video.write"):
+                    writer.write(frame)
+                stats["written"] += 1
+        except Exception as e:
+            errors.append(e)
+        finally:
+            if writer is not None:
+                writer.release()
+
+    writer_thread = threading.Thread(target=write_frames, name="video-writer", daemon=True)
+    writer_thread.start()
+
+    cam.start()
+    try:
+        start_time = tm.time()
+        while tm.time() - start_time < duration_sec and not errors:
+            with tracer.span("video.get_frame"):
+                np_img, _ = cam.get_frame(1000)
+            if np_img is None:
+                stats["incomplete"] += 1
+                print("⚠️ Skipped incomplete frame.")
+                continue
+            try:
+                frames.put_nowait(np_img)
+            except queue.Full:
+                stats["dropped"] += 1
+                continue
+            stats["captured"] += 1
+            stats["queue_high_water"] = max(stats["queue_high_water"], frames.qsize())
+    finally:
+        cam.stop()
+        while writer_thread.is_alive():  # a dead writer would never make room in the queue
+            try:
+                frames.put(None, timeout=0.5)
+                break
+            except queue.Full:
+                pass
+        writer_thread.join()
+    if errors:
+        raise RuntimeError(f"Video writer failed: {errors[0]}") from errors[0]
+
+    tracer.dump(filepath[:-4] + "_trace.json")
+    if not stats["written"]:
+        print("❌ No frames captured.")
+        return stats
+
+    print(f"💾 Video saved: {filepath}")
+    print(
+        f"📊 {stats['written']} frames written, {stats['dropped']} dropped (backpressure), "
+        f"{stats['incomplete']} incomplete, queue high-water {stats['queue_high_water']}/{queue_size}"
+    )
+    return stats
+
+
+def run_raw_video(cam, duration_sec, output_dir, prefix="video", barcode="000000"):
+    """Record a continuous stream into a memory-mapped .praw file at disk bandwidth.
+
+    Each frame is copied once, from the camera buffer into the mapped file, with its
+    timestamp and grab number in the .praw.idx index. Use raw_store.RawFrameReader to read
+    frames back and raw_store.transcode to make an AVI/MP4/PNG copy afterwards. Raw Bayer
+    frames (a Daheng camera opened with color=False) are stored as they are, and
+    demosaiced by transcode or raw_store.demosaic_file."""
+    print(f"🎥 Starting raw recording for {duration_sec} seconds")
+    tracer.reset()  # the saved trace covers this run only
+
+    filepath = os.path.join(output_dir, f"{prefix}_{barcode}_{int(tm.time())}.praw")
+    stats = {"captured": 0, "written": 0, "dropped": 0, "incomplete": 0, "queue_high_water": 0}
+    store = None
+    grab_id = 0
+    pattern = cam.bayer_pattern()
+
+    def append(buf):
+        nonlocal store
+        if store is None:
+            pixel_format = f"{pattern}{buf.dtype.itemsize * 8}" if pattern else None
+            store = RawFrameWriter(filepath, buf.shape, buf.dtype, pixel_format)
+        with tracer.span("raw.append"):
+            return store.append(buf, tm.time(), grab_id)
+
+    cam.start()
+    try:
+        start_time = tm.time()
+        while tm.time() - start_time < duration_sec:
+            index, _ = cam.get_frame(1000, process=append)
+            grab_id += 1
+            if index is None:
+                stats["incomplete"] += 1
+                continue
+            stats["captured"] += 1
+            stats["written"] += 1
+    finally:
+        cam.stop()
+        if store is not None:
+            store.close()
+
+    tracer.dump(filepath[:-5] + "_trace.json")
+    if not stats["written"]:
+        print("❌ No frames captured.")
+        return stats
+    print(f"💾 Raw video saved: {filepath} ({stats['written']} frames, {stats['incomplete']} incomplete)")
+    return stats
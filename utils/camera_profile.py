@@ -0,0 +1,127 @@
+"""Camera settings profiles: snapshot the node map, re-apply only what differs."""
+
+import json
+import os
+import time as tm
+
+PROFILE_DIR = os.path.join(os.getcwd(), "users", "profiles")
+
+# Write order that respects GenICam dependencies: pixel format and binning bound the
+# sensor size, the size bounds the offsets, auto modes must be off before manual values
+# stick, and the frame rate limit depends on everything before it.
+NODE_ORDER = [
+    "PixelFormat", "BinningHorizontal", "BinningVertical", "Width", "Height", "OffsetX", "OffsetY",
+    "AcquisitionMode", "ExposureAuto", "ExposureTime", "GainAuto", "Gain",
+    "AcquisitionFrameRateEnable", "AcquisitionFrameRate",
+]
+# Features the camera only accepts while it is not streaming
+STREAM_LOCKED = {"PixelFormat", "BinningHorizontal", "BinningVertical", "Width", "Height", "OffsetX", "OffsetY"}
+ROI_NODES = {"Width", "Height", "OffsetX", "OffsetY"}
+
+
+def _normalize(value):
+    text = str(value).strip().lower()
+    if text in ("true", "false"):
+        return float(text == "true")
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def same_value(a, b):
+    """True if two node values are equal, whether read back as numbers or as strings
+    ("1000" vs 1000.0, "True" vs True)."""
+    a, b = _normalize(a), _normalize(b)
+    if isinstance(a, float) and isinstance(b, float):
+        return abs(a - b) <= 1e-6 * max(abs(a), abs(b), 1.0)
+    return a == b
+
+
+class CameraProfile:
+    """A named set of camera node values. snapshot() reads them off a camera; apply()
+    writes to a camera only the values that differ from what it currently has, in
+    NODE_ORDER, so switching between known configurations costs a few node reads
+    instead of a full re-setup. Profiles are saved as JSON under users/profiles/."""
+
+    def __init__(self, name, values, backend=None):
+        self.name = name
+        self.values = dict(values)
+        self.backend = backend
+
+    @classmethod
+    def snapshot(cls, cam, name="current", nodes=NODE_ORDER):
+        """Reads the current values of 'nodes' from a camera backend, skipping any the
+        camera does not have."""
+        values = {}
+        for node in nodes:
+            value = cam.get_node(node)
+            if value is not None:
+                values[node] = value
+        return cls(name, values, cam.name)
+
+    def updated(self, name=None, **values):
+        """A copy of this profile with some values replaced, e.g. ExposureTime=2000."""
+        return CameraProfile(name or self.name, {**self.values, **values}, self.backend)
+
+    def diff(self, current):
+        """The values of this profile that differ from 'current' (a CameraProfile), in
+        write order."""
+        return {node: self.values[node] for node in self._ordered()
+                if node not in current.values or not same_value(self.values[node], current.values[node])}
+
+    def _ordered(self):
+        return [n for n in NODE_ORDER if n in self.values] + [n for n in self.values if n not in NODE_ORDER]
+
+    def apply(self, cam, current=None):
+        """Brings 'cam' to this profile, writing only the differing nodes. 'current' is the
+        camera's present profile if already known; otherwise it is read from the camera.
+        A streaming camera is stopped for features that need it and restarted after.
+        Returns the dict of values written, or None if a write failed."""
+        if self.backend is not None and self.backend != cam.name:
+            print(f"⚠️ Profile '{self.name}' is for {self.backend} cameras, not {cam.name}")
+            return None
+        t0 = tm.perf_counter()
+        changes = self.diff(current if current is not None else CameraProfile.snapshot(cam, nodes=self._ordered()))
+        if not changes:
+            return changes
+        restart = cam.is_streaming and any(node in STREAM_LOCKED for node in changes)
+        if restart:
+            cam.stop()
+        try:
+            if ROI_NODES & changes.keys():
+                # Clear the offsets first so a larger Width/Height always fits, then
+                # write them back after the size
+                cleared = [node for node in ("OffsetX", "OffsetY")
+                           if node in self.values and not same_value(cam.get_node(node), 0)]
+                for node in cleared:
+                    cam.set_node(node, 0)
+                changes = {node: self.values[node] for node in self._ordered() if node in changes or node in cleared}
+            for node, value in changes.items():
+                if not cam.set_node(node, value):
+                    print(f"❌ Could not set {node} to {value} from profile '{self.name}'")
+                    return None
+        finally:
+            if restart:
+                cam.start()
+        print(f"⚙️ Profile '{self.name}': {len(changes)} setting(s) changed in "
+              f"{(tm.perf_counter() - t0) * 1000:.0f} ms ({', '.join(changes)})")
+        return changes
+
+    def save(self, directory=PROFILE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{self.name}.json"), "w") as f:
+            json.dump({"backend": self.backend, "values": self.values}, f, indent=2)
+
+    @classmethod
+    def load(cls, name, directory=PROFILE_DIR):
+        with open(os.path.join(directory, f"{name}.json")) as f:
+            data = json.load(f)
+        return cls(name, data["values"], data.get("backend"))
+
+
+def list_profiles(directory=PROFILE_DIR):
+    """Names of the saved profiles."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(f[:-5] for f in os.listdir(directory) if f.endswith(".json"))
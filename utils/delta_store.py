@@ -0,0 +1,93 @@
+"""Change-aware timelapse storage: full keyframes, and deltas or references in between."""
+
+import json
+import os
+
+import cv2
+
+import utils.frame_ops as fo
+
+
+class DeltaWriter:
+    """Stores a timelapse as keyframes plus whatever changed since them. Each frame is
+    compared with the last keyframe (frame_ops.frame_change); if it changed by at least
+    'threshold' (fraction of full scale), or the last keyframe is 'keyframe_every' frames
+    back, it is saved in full as a new keyframe. Otherwise:
+
+    - lossless=True: the difference to the keyframe is saved, wrapped around in the
+      frame's own dtype, as a "_delta" image. Nearly identical frames give a nearly
+      constant image that compresses well, and DeltaReader rebuilds the frame bit-exact.
+    - lossless=False: nothing is saved and the frame is replaced by its keyframe.
+
+    Images go through 'writer' (an ImageWriterPool, so PNG or TIFF, both lossless). What
+    each frame became is logged to <prefix>_<barcode>_frames.jsonl, which DeltaReader reads."""
+
+    def __init__(self, path, prefix, barcode, writer, threshold=0.02, keyframe_every=30, lossless=True,
+                 factor=8):
+        self.path = path
+        self.prefix = prefix
+        self.barcode = barcode
+        self.writer = writer
+        self.threshold = threshold
+        self.keyframe_every = keyframe_every
+        self.lossless = lossless
+        self.factor = factor
+        self.index_path = os.path.join(path, f"{prefix}_{barcode}_frames.jsonl")
+        self.counts = {"key": 0, "delta": 0, "ref": 0}
+        self._key = None
+        self._key_file = None
+        self._since_key = 0
+
+    def append(self, frame, index, stamp, metadata=None):
+        """Stores one frame; 'stamp' is the time string used in file names. Returns the
+        kind of record written: "key", "delta" or "ref"."""
+        base = os.path.join(self.path, f"{self.prefix}_{self.barcode}_{stamp}")
+        change = None if self._key is None else fo.frame_change(frame, self._key, self.factor)
+        if change is None or change >= self.threshold or self._since_key >= self.keyframe_every - 1:
+            kind, filename = "key", base
+            self._key, self._key_file, self._since_key = frame, os.path.basename(base) + self.writer.ext, 0
+            self.writer.submit(frame, base, metadata)
+        elif self.lossless:
+            kind, filename = "delta", base + "_delta"
+            # uint8/uint16 subtraction wraps around, and adding it back to the keyframe undoes it exactly
+            self.writer.submit(frame - self._key, filename, metadata)
+        else:
+            kind, filename = "ref", None
+        self._since_key += kind != "key"
+        self.counts[kind] += 1
+        record = {"frame": index, "stamp": stamp, "kind": kind, "key": self._key_file,
+                  "file": os.path.basename(filename) + self.writer.ext if filename else None,
+                  "change": change, **(metadata or {})}
+        with open(self.index_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        return kind
+
+    def close(self):
+        print(f"🗜️ Stored {self.counts['key']} keyframes, {self.counts['delta']} deltas and "
+              f"{self.counts['ref']} references")
+
+
+class DeltaReader:
+    """Reads back a timelapse written by DeltaWriter, given its _frames.jsonl index."""
+
+    def __init__(self, index_path):
+        self.dir = os.path.dirname(index_path)
+        with open(index_path) as f:
+            self.records = [json.loads(line) for line in f if line.strip()]
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def _load(self, filename):
+        if filename not in self._cache:
+            self._cache = {filename: cv2.imread(os.path.join(self.dir, filename), cv2.IMREAD_UNCHANGED)}
+        return self._cache[filename]
+
+    def frame(self, i):
+        """Frame i of the run: exact for keyframes and deltas, the keyframe for references."""
+        record = self.records[i]
+        if record["kind"] == "delta":
+            delta = cv2.imread(os.path.join(self.dir, record["file"]), cv2.IMREAD_UNCHANGED)
+            return self._load(record["key"]) + delta
+        return self._load(record["key"]).copy()
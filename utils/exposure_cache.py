@@ -0,0 +1,114 @@
+"""Metered exposure times, cached per camera, sensor mode and LED combination."""
+
+import json
+import os
+import time as tm
+
+import utils.frame_ops as fo
+from utils.led_protocol import LED_ORDER, OFF
+
+CACHE_PATH = os.path.join(os.getcwd(), "users", "calibration", "exposure.json")
+
+
+def brightness(frame):
+    """Mean pixel value of a frame as a fraction of full scale (0-1)."""
+    full = 65535.0 if frame.dtype.itemsize > 1 else 255.0
+    return fo.mean_intensity(frame) / full
+
+
+def _grab(cam, timeout_ms):
+    # Two frames, so a frame exposed before the last change is never the one measured.
+    streaming = cam.is_streaming
+    if not streaming:
+        cam.start(newest_only=True)
+    try:
+        cam.get_frame(timeout_ms)
+        frame, _ = cam.get_frame(timeout_ms)
+    finally:
+        if not streaming:
+            cam.stop()
+    if frame is None:
+        raise RuntimeError("No frame to meter exposure on")
+    return frame
+
+
+def meter_exposure(cam, target=0.45, start_us=10000, min_us=20, max_us=1_000_000, tolerance=0.05,
+                   max_steps=8, timeout_ms=5000):
+    """Finds the exposure that brings the mean image brightness to 'target' (fraction of
+    full scale) with the lights as they are now, scaling the exposure by target/measured
+    (at most 4x per step) until it is within 'tolerance' of the target or hits a limit.
+    Leaves the camera at that exposure and returns (exposure_us, brightness)."""
+    exposure = min(max(start_us, min_us), max_us)
+    for _ in range(max_steps):
+        cam.configure(exposure_us=int(exposure))
+        level = brightness(_grab(cam, timeout_ms))
+        if abs(level - target) <= tolerance * target:
+            break
+        step = min(max(target / max(level, 1e-4), 0.25), 4.0)
+        new = min(max(exposure * step, min_us), max_us)
+        if int(new) == int(exposure):
+            break  # pinned at a limit
+        exposure = new
+    return int(exposure), level
+
+
+class ExposureCache:
+    """Remembers metered exposures across runs and sessions, in a JSON file under
+    users/calibration/. Entries are keyed by camera serial, gain, binning and the LED
+    combination, and are re-metered when older than 'max_age_s' or when a one-frame
+    check at the cached exposure is off its recorded brightness by more than
+    'check_tolerance' (relative), e.g. after an LED was replaced or the plate changed."""
+
+    def __init__(self, path=CACHE_PATH, max_age_s=7 * 24 * 3600, check_tolerance=0.2, target=0.45):
+        self.path = path
+        self.max_age_s = max_age_s
+        self.check_tolerance = check_tolerance
+        self.target = target
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Ignoring unreadable exposure cache {path}: {e}")
+
+    @staticmethod
+    def key(cam, states):
+        """Cache key for a camera in its current sensor mode under the LED 'states'
+        (a dict of LED name -> ON/OFF, as used by led_protocol)."""
+        mode = cam.sensor_mode()
+        leds = "".join(str(int(states.get(name, OFF))) for name in LED_ORDER)
+        return f"{cam.serial}|gain={mode['gain']}|binning={mode['binning']}|leds={leds}"
+
+    def exposure_for(self, cam, states, check=True):
+        """Sets and returns the exposure for 'cam' under the LED 'states', which must
+        already be applied. A fresh cached value is reused (after a brightness check unless
+        check=False); otherwise the exposure is metered, starting from the cached value."""
+        key = self.key(cam, states)
+        entry = self.entries.get(key)
+        if entry is not None and tm.time() - entry["metered_at"] <= self.max_age_s:
+            cam.configure(exposure_us=entry["exposure_us"])
+            if not check:
+                return entry["exposure_us"]
+            level = brightness(_grab(cam, 5000))
+            if abs(level - entry["brightness"]) <= self.check_tolerance * entry["brightness"]:
+                print(f"📋 Cached exposure {entry['exposure_us']} μs for {key}")
+                return entry["exposure_us"]
+            print(f"⚠️ Brightness {level:.3f} vs cached {entry['brightness']:.3f} for {key}; re-metering")
+        exposure, level = meter_exposure(cam, self.target, entry["exposure_us"] if entry else 10000)
+        self.entries[key] = {"exposure_us": exposure, "brightness": level, "metered_at": tm.time()}
+        self.save()
+        print(f"🔆 Metered exposure {exposure} μs (brightness {level:.3f}) for {key}")
+        return exposure
+
+    def invalidate(self, serial=None):
+        """Drops every entry, or only those of one camera."""
+        self.entries = {k: v for k, v in self.entries.items() if serial is not None and not k.startswith(f"{serial}|")}
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp, self.path)
@@ -0,0 +1,110 @@
+"""Small, vectorized numpy helpers for working on camera frames."""
+
+import os
+
+import cv2
+import numpy as np
+
+# Sensor pattern (GenICam name, as reported by the camera) -> OpenCV conversion to RGB.
+# OpenCV names its Bayer codes after the second row of the pattern, hence the swaps.
+BAYER_CODES = {
+    "BayerRG": cv2.COLOR_BayerBG2RGB,
+    "BayerBG": cv2.COLOR_BayerRG2RGB,
+    "BayerGR": cv2.COLOR_BayerGB2RGB,
+    "BayerGB": cv2.COLOR_BayerGR2RGB,
+}
+
+
+def fit_factor(shape, size):
+    """Returns the smallest integer downsampling factor that makes a frame of 'shape'
+    (rows, cols, ...) fit inside 'size' (width, height)."""
+    h, w = shape[:2]
+    return max(1, -(-w // size[0]), -(-h // size[1]))
+
+
+def decimate(frame, factor, method="area"):
+    """Downsamples a frame by an integer factor. 'stride' keeps every factor-th pixel and
+    costs nothing (it returns a view); 'area' averages each factor x factor block."""
+    if factor <= 1:
+        return frame
+    if method == "stride":
+        return frame[::factor, ::factor]
+    if method != "area":
+        raise ValueError(f"Unknown decimation method: {method}")
+    h = frame.shape[0] // factor * factor
+    w = frame.shape[1] // factor * factor
+    blocks = frame[:h, :w].reshape(h // factor, factor, w // factor, factor, *frame.shape[2:])
+    return (blocks.sum(axis=(1, 3), dtype=np.uint32) // (factor * factor)).astype(frame.dtype)
+
+
+def to_display(frame):
+    """Returns a C-contiguous uint8 copy of a frame, ready to be wrapped by a QImage."""
+    if frame.dtype == np.uint16:
+        frame = frame >> 8
+    return np.ascontiguousarray(frame, dtype=np.uint8)
+
+
+def mean_intensity(frame, factor=16):
+    """Mean pixel value of a frame, estimated from every factor-th pixel."""
+    return float(frame[::factor, ::factor].mean())
+
+
+def otsu_threshold(frame, factor=4):
+    """Otsu's threshold of a frame, from the histogram of every factor-th pixel."""
+    sample = frame[::factor, ::factor]
+    if sample.ndim == 3:
+        sample = sample.mean(axis=2)
+    top = 65536 if frame.dtype == np.uint16 else 256
+    hist = np.bincount(sample.astype(np.int64).ravel(), minlength=top)[:top].astype(np.float64)
+    levels = np.arange(top)
+    weight = np.cumsum(hist)
+    total = weight[-1]
+    cum_mean = np.cumsum(hist * levels)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (cum_mean[-1] * weight - cum_mean * total) ** 2 / (weight * (total - weight))
+    return int(np.nanargmax(between))
+
+
+def frame_change(a, b, factor=8):
+    """Mean absolute difference between two frames as a fraction of full scale (0-1),
+    estimated from every factor-th pixel; cheap enough to run on every capture."""
+    full = 65535.0 if a.dtype == np.uint16 else 255.0
+    diff = np.abs(a[::factor, ::factor].astype(np.int32) - b[::factor, ::factor])
+    return float(diff.mean()) / full
+
+
+def _demosaic_batch(frames, code, out=None):
+    if out is None:
+        out = np.empty((*frames.shape, 3), dtype=frames.dtype)
+    for frame, dst in zip(frames, out):
+        cv2.cvtColor(frame, code, dst=dst)
+    return out
+
+
+def demosaic(frames, pattern, out=None, batch=32, pool=None):
+    """Converts raw Bayer frames, one (H, W) or a stack (n, H, W), to RGB (..., H, W, 3)
+    of the same dtype. 'pattern' is the sensor's pattern ("BayerRG", or a pixel format
+    such as "BayerRG8"). The frames are converted 'batch' at a time into one output array
+    ('out' if given); with 'pool' (e.g. a ProcessPoolExecutor) the batches are spread
+    over its workers, a few at a time so memory stays bounded."""
+    code = BAYER_CODES[pattern[:7]]
+    frames = np.asarray(frames)
+    single = frames.ndim == 2
+    if single:
+        frames = frames[None]
+    if out is None:
+        out = np.empty((*frames.shape, 3), dtype=frames.dtype)
+    spans = [(a, min(a + batch, len(frames))) for a in range(0, len(frames), batch)]
+    if pool is None:
+        for a, b in spans:
+            _demosaic_batch(frames[a:b], code, out[a:b])
+    else:
+        in_flight = []
+        for a, b in spans:
+            in_flight.append((a, b, pool.submit(_demosaic_batch, np.ascontiguousarray(frames[a:b]), code)))
+            if len(in_flight) >= 2 * (os.cpu_count() or 1):
+                a0, b0, future = in_flight.pop(0)
+                out[a0:b0] = future.result()
+        for a, b, future in in_flight:
+            out[a:b] = future.result()
+    return out[0] if single else out
@@ -0,0 +1,131 @@
+"""Background image encoding and saving, off the acquisition path."""
+
+import json
+import os
+import threading
+import time as tm
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+
+from utils.tracing import tracer
+
+FORMATS = {"png": ".png", "tiff": ".tiff"}
+
+
+def encode_params(fmt, compression):
+    """OpenCV imwrite parameters for a format. For PNG 'compression' is the zlib level
+    (0-9, 1 is fast, 9 is small); for TIFF 0 means uncompressed and anything else LZW."""
+    if fmt == "png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(compression)]
+    if fmt == "tiff":
+        return [cv2.IMWRITE_TIFF_COMPRESSION, 5 if compression else 1]
+    raise ValueError(f"Unknown image format: {fmt}")
+
+
+def _encode_and_write(frame, filepath, ext, params):
+    t0 = tm.perf_counter()
+    ok, buf = cv2.imencode(ext, frame, params)
+    if not ok:
+        raise IOError(f"Could not encode {filepath}")
+    t1 = tm.perf_counter()
+    with open(filepath, "wb") as f:
+        f.write(buf)
+    # perf_counter is system-wide, so the start time also means something in a worker process
+    return t0, t1 - t0, tm.perf_counter() - t1, len(buf)
+
+
+class ImageWriterPool:
+    """Encodes and saves frames on worker threads (or processes) so the capture path only
+    pays for handing the frame over. At most 'max_pending' frames wait in memory; submit()
+    blocks beyond that so a slow disk cannot exhaust RAM.
+
+    Each saved file is recorded with its encode and write latency and the metadata given
+    to submit(); when 'index_path' is set the records are also appended there as JSON lines."""
+
+    def __init__(self, fmt="png", compression=3, workers=2, use_processes=False, max_pending=16,
+                 index_path=None):
+        self.fmt = fmt
+        self.ext = FORMATS[fmt]
+        self.params = encode_params(fmt, compression)
+        self.index_path = index_path
+        self.records = []
+        executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self._pool = executor(max_workers=workers)
+        self._slots = threading.Semaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._started = tm.perf_counter()
+
+    def submit(self, frame, filepath, metadata=None):
+        """Queues 'frame' to be saved at 'filepath' (the format's extension is added).
+        The pool takes ownership of the array, so pass a copy of any camera buffer."""
+        filepath += self.ext
+        self._slots.acquire()
+        future = self._pool.submit(_encode_and_write, frame, filepath, self.ext, self.params)
+        with self._lock:
+            self._pending.add(future)
+            if future.done():
+                self._pending.discard(future)
+        future.add_done_callback(lambda f: self._done(f, filepath, metadata or {}))
+        return future
+
+    def _done(self, future, filepath, metadata):
+        self._slots.release()
+        with self._lock:
+            self._pending.discard(future)
+        if future.exception() is not None:
+            print(f"❌ Failed to save {filepath}: {future.exception()}")
+            return
+        start, encode_s, write_s, nbytes = future.result()
+        tracer.record("writer.encode", start, encode_s)
+        tracer.record("writer.write", start + encode_s, write_s)
+        record = {"file": os.path.basename(filepath), "encode_ms": encode_s * 1000,
+                  "write_ms": write_s * 1000, "bytes": nbytes, **metadata}
+        with self._lock:
+            self.records.append(record)
+            if self.index_path:
+                with open(self.index_path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+        print(f"💾 Saved: {filepath} (encode {encode_s * 1000:.0f} ms)")
+
+    def flush(self):
+        """Waits until every submitted frame is on disk."""
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            try:
+                future.result()
+            except Exception:
+                pass  # already reported in _done
+
+    def stats(self):
+        """Per-file encode latency and overall write throughput of the pool so far."""
+        with self._lock:
+            records = list(self.records)
+        elapsed = tm.perf_counter() - self._started
+        encode = sorted(r["encode_ms"] for r in records)
+        total_bytes = sum(r["bytes"] for r in records)
+        return {
+            "files": len(records),
+            "encode_ms_mean": sum(encode) / len(encode) if encode else 0.0,
+            "encode_ms_max": encode[-1] if encode else 0.0,
+            "mb_written": total_bytes / 1e6,
+            "mb_per_sec": total_bytes / 1e6 / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def close(self):
+        """Flushes pending frames, stops the workers and prints a summary."""
+        self.flush()
+        self._pool.shutdown(wait=True)
+        s = self.stats()
+        if s["files"]:
+            print(f"📊 Writer: {s['files']} files, encode {s['encode_ms_mean']:.0f} ms mean / "
+                  f"{s['encode_ms_max']:.0f} ms max, {s['mb_per_sec']:.1f} MB/s")
+        return s
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,170 @@
+"""The Arduino LED protocol, plus a fake Arduino to test and benchmark it without hardware.
+
+Besides the per-LED "SET LED_<x>_STATUS <v>;" commands, the firmware accepts
+"SET LEDS <trans><460><535><590><670>;", which switches every LED at once and replies
+with a single "LEDS <digits>" line once the pins are set."""
+
+import collections
+import threading
+import time as tm
+
+ARDUINO_BAUD = 115200  # must match BAUD_RATE in arduino-led.ino
+LED_ORDER = ("TRANS", "460", "535", "590", "670")
+ON, OFF = 0, 1  # status values as wired: an LED is lit when its status is 0
+
+
+def led_states(bed_on, colors, colors_on):
+    """Builds a full LED state from the GUI's view of it: the LED bed, and the color LEDs
+    selected in 'colors' (wavelength -> enabled). Colors that are not selected stay off."""
+    states = {"TRANS": ON if bed_on else OFF}
+    for wl in LED_ORDER[1:]:
+        states[wl] = ON if colors_on and colors.get(wl, False) else OFF
+    return states
+
+
+def leds_command(states):
+    """Formats the batched command for a full LED state (name -> status value)."""
+    return ("SET LEDS " + "".join(str(int(states[name])) for name in LED_ORDER) + ";").encode()
+
+
+def parse_leds_reply(line):
+    """Returns the LED state reported in a "LEDS <digits>" reply, or None."""
+    line = line.decode(errors="replace").strip() if isinstance(line, bytes) else line.strip()
+    if not line.startswith("LEDS ") or len(line) < 5 + len(LED_ORDER):
+        return None
+    digits = line[5:5 + len(LED_ORDER)]
+    return {name: int(d) for name, d in zip(LED_ORDER, digits)}
+
+
+def parse_reply(line):
+    """Parses one firmware reply line into (name, value): ("LEDS", {led: status}) for the
+    batched command, ("LED_<x>_STATUS", number) for the others, or None if unreadable."""
+    line = line.decode(errors="replace").strip() if isinstance(line, bytes) else line.strip()
+    leds = parse_leds_reply(line)
+    if leds is not None:
+        return "LEDS", leds
+    parts = line.split()
+    if len(parts) != 2:
+        return None
+    try:
+        return parts[0], float(parts[1])
+    except ValueError:
+        return None
+
+
+def set_all_leds(dev, states):
+    """Switches every LED with one command and waits for the firmware's acknowledgement
+    (up to the port's read timeout). Returns True once the firmware confirms the state.
+    'dev' is a serial port or a SerialManager."""
+    if hasattr(dev, "set_leds"):
+        try:
+            return dev.set_leds(states).result()
+        except Exception as e:
+            print("Error setting LEDs:", e)
+            return False
+    try:
+        dev.reset_input_buffer()  # drop replies nobody read
+        dev.write(leds_command(states))
+        reply = parse_leds_reply(dev.readline())
+    except Exception as e:
+        print("Error setting LEDs:", e)
+        return False
+    if reply != {name: int(states[name]) for name in LED_ORDER}:
+        print(f"⚠️ LED state not acknowledged (got {reply})")
+        return False
+    return True
+
+
+def wait_for_firmware(dev, timeout=5.0):
+    """Waits until the firmware answers "GET LEDS" (the board resets when the port is
+    opened and ignores input until its bootloader is done). Returns True once it replies,
+    without sleeping any longer than that."""
+    deadline = tm.monotonic() + timeout
+    while tm.monotonic() < deadline:
+        try:
+            dev.reset_input_buffer()
+            dev.write(b"GET LEDS;")
+            if parse_leds_reply(dev.readline()) is not None:
+                return True
+        except Exception as e:
+            print("Error waiting for Arduino:", e)
+            return False
+        tm.sleep(0.1)
+    return False
+
+
+class FakeArduino:
+    """Stands in for a serial.Serial connected to the LED firmware. It understands the
+    same commands, keeps the same state and replies the same way, and it charges the
+    time the bytes would take on the wire at 'baudrate' (10 bits per byte), so protocol
+    latency can be measured without an Arduino."""
+
+    def __init__(self, baudrate=ARDUINO_BAUD, timeout=2):
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.is_open = True
+        self.state = {name: 0 for name in LED_ORDER}
+        self._buffer = b""
+        self._replies = collections.deque()  # (ready_at, line)
+        self._cond = threading.Condition()
+
+    def _wire_time(self, n_bytes):
+        return n_bytes * 10 / self.baudrate
+
+    def write(self, data):
+        tm.sleep(self._wire_time(len(data)))
+        with self._cond:
+            self._buffer += data
+            while b";" in self._buffer:
+                command, self._buffer = self._buffer.split(b";", 1)
+                reply = self._handle(command.decode().upper().strip())
+                if reply:
+                    line = (reply + "\r\n").encode()
+                    self._replies.append((tm.monotonic() + self._wire_time(len(line)), line))
+            self._cond.notify_all()
+        return len(data)
+
+    def _handle(self, command):
+        if command == "GET LEDS":
+            return "LEDS " + "".join(str(self.state[n]) for n in LED_ORDER)
+        if command.startswith("SET LEDS "):
+            digits = command[9:]
+            if len(digits) < len(LED_ORDER):
+                return "ERR LEDS"
+            for name, d in zip(LED_ORDER, digits):
+                self.state[name] = int(d == "1")
+            return "LEDS " + "".join(str(self.state[n]) for n in LED_ORDER)
+        for name in LED_ORDER:
+            var = f"LED_{name}_STATUS"
+            if command.startswith("GET " + var):
+                return f"{var} {self.state[name]}"
+            if command.startswith("SET " + var + " "):
+                self.state[name] = int(float(command[len(var) + 5:]))
+                return f"{var} {self.state[name]}"
+        return None
+
+    def readline(self):
+        deadline = tm.monotonic() + (self.timeout if self.timeout is not None else 1e9)
+        with self._cond:
+            while not self._replies:
+                remaining = deadline - tm.monotonic()
+                if remaining <= 0:
+                    return b""
+                self._cond.wait(remaining)
+            ready_at, line = self._replies.popleft()
+        delay = ready_at - tm.monotonic()
+        if delay > 0:
+            tm.sleep(delay)
+        return line
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            return sum(len(line) for _, line in self._replies)
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._replies.clear()
+
+    def close(self):
+        self.is_open = False
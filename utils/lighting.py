@@ -0,0 +1,68 @@
+"""Light switching that waits for the light, not for a fixed delay."""
+
+import time as tm
+
+import utils.frame_ops as fo
+from utils.led_protocol import set_all_leds
+from utils.tracing import tracer
+
+
+class LightingController:
+    """Switches the LEDs and returns as soon as the new light is there.
+
+    apply() sends the whole LED state as one batched command and waits for the firmware
+    to acknowledge it. If a streaming camera is available and settle is requested, it
+    then grabs low-resolution frames until their mean intensity stops changing: the
+    relative change between consecutive frames must stay within 'tolerance' for
+    'stable_frames' frames, for at most 'max_settle_s'. Only when a switch is not
+    acknowledged (a reply lost or timed out) does it fall back to 'fallback_delay_s'.
+    Firmware without the batched command never gets connected by SerialManager; it has to
+    be reflashed (see the README)."""
+
+    def __init__(self, dev, cam=None, tolerance=0.01, stable_frames=2, max_settle_s=5.0, fallback_delay_s=5.0):
+        self.dev = dev
+        self.cam = cam
+        self.tolerance = tolerance
+        self.stable_frames = stable_frames
+        self.max_settle_s = max_settle_s
+        self.fallback_delay_s = fallback_delay_s
+        self.last = {}
+
+    def apply(self, states, settle=True):
+        """Sets the LED state and waits for it. Returns the timings of this switch."""
+        t0 = tm.perf_counter()
+        acked = set_all_leds(self.dev, states) if self.dev is not None else False
+        ack_ms = (tm.perf_counter() - t0) * 1000
+        tracer.record("lights.ack", t0, ack_ms / 1000)
+        settled = None
+        if settle:
+            with tracer.span("lights.settle"):
+                if self.cam is not None and self.cam.is_streaming:
+                    settled = self.wait_for_settle()
+                elif not acked and self.dev is not None:
+                    tm.sleep(self.fallback_delay_s)
+        self.last = {"acked": acked, "ack_ms": ack_ms, "settled": settled,
+                     "total_ms": (tm.perf_counter() - t0) * 1000}
+        if settle:
+            print(f"💡 Lights switched in {self.last['total_ms']:.0f} ms "
+                  f"(ack {ack_ms:.0f} ms{', settled' if settled else ''})")
+        return self.last
+
+    def wait_for_settle(self):
+        """Grabs frames until the mean brightness is stable. Returns False on timeout."""
+        start = tm.monotonic()
+        prev = None
+        stable = 0
+        while tm.monotonic() - start < self.max_settle_s:
+            mean, _ = self.cam.get_frame(1000, process=fo.mean_intensity)
+            if mean is None:
+                continue
+            if prev is not None and abs(mean - prev) <= self.tolerance * max(prev, 1.0):
+                stable += 1
+                if stable >= self.stable_frames:
+                    return True
+            else:
+                stable = 0
+            prev = mean
+        print("⚠️ Light did not settle in time.")
+        return False
@@ -0,0 +1,97 @@
+"""Online per-frame and per-well measurements, computed while acquisition runs."""
+
+import csv
+import os
+import queue
+import threading
+
+import numpy as np
+
+import utils.frame_ops as fo
+
+
+def region_metrics(regions, threshold, percentiles=(5, 50, 95)):
+    """Measures a stack of equally sized regions (n, h, w[, C]) in one vectorized pass:
+    mean and percentile intensity, the area above 'threshold' in pixels and the centroid
+    (x, y) of that area within the region (NaN if the area is empty)."""
+    if regions.ndim == 4:
+        regions = regions.mean(axis=3)
+    n, h, w = regions.shape
+    flat = regions.reshape(n, -1)
+    mask = regions > threshold
+    area = mask.sum(axis=(1, 2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cx = (mask.sum(axis=1) * np.arange(w)).sum(axis=1) / area
+        cy = (mask.sum(axis=2) * np.arange(h)).sum(axis=1) / area
+    result = {"mean": flat.mean(axis=1)}
+    for p, values in zip(percentiles, np.percentile(flat, percentiles, axis=1)):
+        result[f"p{p}"] = values
+    result.update({"area": area, "centroid_x": cx, "centroid_y": cy})
+    return result
+
+
+class MetricsWorker:
+    """Measures frames on a background thread and appends one row per region to a CSV
+    (the whole frame as "frame", then every well of 'grid' if one is given), flushed after
+    each frame so growth curves can be followed during the run. Well centroids are in
+    frame coordinates. 'threshold' separates plant from background; None uses Otsu's
+    threshold of each frame."""
+
+    def __init__(self, csv_path, grid=None, threshold=None, percentiles=(5, 50, 95), max_pending=8):
+        self.csv_path = csv_path
+        self.grid = grid
+        self.threshold = threshold
+        self.percentiles = tuple(percentiles)
+        self.rows = 0
+        self._frames = queue.Queue(maxsize=max_pending)
+        columns = ["frame", "timestamp", "roi", "threshold", "mean",
+                   *(f"p{p}" for p in self.percentiles), "area", "centroid_x", "centroid_y"]
+        new_file = not os.path.exists(csv_path)
+        self._file = open(csv_path, "a", newline="")
+        self._csv = csv.writer(self._file)
+        if new_file:
+            self._csv.writerow(columns)
+        self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, index, timestamp):
+        """Queues a frame for measurement. The worker only reads the array, so it must
+        not be modified afterwards; blocks if 'max_pending' frames are already waiting."""
+        self._frames.put((frame, index, timestamp))
+
+    def _run(self):
+        while True:
+            item = self._frames.get()
+            if item is None:
+                break
+            try:
+                self._measure(*item)
+            except Exception as e:
+                print(f"❌ Metrics failed for frame {item[1]}: {e}")
+
+    def _measure(self, frame, index, timestamp):
+        threshold = self.threshold if self.threshold is not None else fo.otsu_threshold(frame)
+        labels = ["frame"]
+        offsets = np.zeros((1, 2))
+        results = [region_metrics(frame[None], threshold, self.percentiles)]
+        if self.grid is not None:
+            labels += self.grid.labels
+            xs = self.grid.origin[0] + np.arange(self.grid.cols) * self.grid.pitch[0]
+            ys = self.grid.origin[1] + np.arange(self.grid.rows) * self.grid.pitch[1]
+            offsets = np.vstack([offsets, np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)])
+            results.append(region_metrics(self.grid.crop(frame), threshold, self.percentiles))
+        table = {k: np.concatenate([r[k] for r in results]) for k in results[0]}
+        table["centroid_x"] = table["centroid_x"] + offsets[:, 0]
+        table["centroid_y"] = table["centroid_y"] + offsets[:, 1]
+        for i, label in enumerate(labels):
+            self._csv.writerow([index, timestamp, label, threshold,
+                                *(f"{table[k][i]:.6g}" for k in table)])
+        self._file.flush()
+        self.rows += len(labels)
+
+    def close(self):
+        """Measures the frames still queued and closes the CSV."""
+        self._frames.put(None)
+        self._thread.join()
+        self._file.close()
+        print(f"📈 Metrics: {self.rows} rows in {self.csv_path}")
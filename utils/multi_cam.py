@@ -0,0 +1,146 @@
+"""Driving several cameras at once, one acquisition worker per camera."""
+
+import os
+import threading
+import time as tm
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import utils.cam_utils as cu
+from utils.image_writer import ImageWriterPool
+from utils.led_protocol import led_states
+from utils.lighting import LightingController
+from utils.scheduler import TimelapseScheduler
+
+
+class MultiCameraRig:
+    """Several camera backends that capture together.
+
+    Each camera has its own worker thread, and the SDK grab calls release the GIL, so the
+    cameras acquire in parallel and a synchronized capture costs about as much as one
+    camera's. capture() switches the shared light once, then releases every worker
+    through a barrier so all frames are grabbed at the same moment. Output is grouped
+    by camera serial number."""
+
+    def __init__(self, cams, lighting=None):
+        self.cams = list(cams)
+        self.lighting = lighting
+        self._pool = ThreadPoolExecutor(max_workers=len(self.cams), thread_name_prefix="camera")
+
+    @property
+    def serials(self):
+        return [str(cam.serial) for cam in self.cams]
+
+    def configure(self, **settings):
+        """Applies the same settings to every camera. Returns True if all succeeded."""
+        return all(cam.configure(**settings) for cam in self.cams)
+
+    def capture(self, states=None, timeout_ms=5000):
+        """Grabs one frame from every camera under the LED state 'states' (left as is if
+        None). Returns {serial: (frame, timestamp)}; frame is None for a failed grab. A
+        camera that fails breaks the barrier, so the others give up instead of waiting."""
+        barrier = threading.Barrier(len(self.cams))
+
+        def grab(cam):
+            try:
+                cam.start(newest_only=True)
+                try:
+                    barrier.wait(timeout_ms / 1000)  # the light is set: grab together
+                    return cam.get_frame(timeout_ms)
+                finally:
+                    cam.stop()
+            except threading.BrokenBarrierError:
+                print(f"⚠️ Camera {cam.serial}: another camera failed, frame dropped")
+            except Exception as ex:
+                barrier.abort()
+                print(f"❌ Camera {cam.serial} failed: {ex}")
+            return None, tm.time()
+
+        if states is not None and self.lighting is not None:
+            # Settle on the first camera while the others wait at the barrier.
+            first = self.cams[0]
+            first.start(newest_only=True)
+            try:
+                self.lighting.cam = first
+                self.lighting.apply(states)
+            finally:
+                first.stop()
+        futures = [self._pool.submit(grab, cam) for cam in self.cams]
+        return {serial: f.result() for serial, f in zip(self.serials, futures)}
+
+    def run_each(self, func, *args, **kwargs):
+        """Runs func(cam, *args, **kwargs) for every camera on its own worker and returns
+        {serial: result}."""
+        futures = [self._pool.submit(func, cam, *args, **kwargs) for cam in self.cams]
+        return {serial: f.result() for serial, f in zip(self.serials, futures)}
+
+    def output_dirs(self, path):
+        """Creates and returns {serial: path/serial}."""
+        dirs = {serial: os.path.join(path, serial) for serial in self.serials}
+        for d in dirs.values():
+            os.makedirs(d, exist_ok=True)
+        return dirs
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+def run_single_image_multi(rig, output_dir, prefix="single", barcode="000000"):
+    """Captures one synchronized image per camera into output_dir/<serial>/."""
+    dirs = rig.output_dirs(output_dir)
+    with ImageWriterPool(workers=len(rig.cams)) as writer:
+        for serial, (frame, ts) in rig.capture().items():
+            if frame is None:
+                print(f"⚠️ Camera {serial}: image incomplete. Skipping.")
+                continue
+            writer.submit(frame, os.path.join(dirs[serial], f"{prefix}_{barcode}_{int(ts)}"),
+                          {"camera": serial, "timestamp": ts})
+
+
+def run_video_multi(rig, duration_sec, output_dir, prefix="video", barcode="000000", fps=30.0, container="avi"):
+    """Records video from every camera at once, each on its own worker, into
+    output_dir/<serial>/. Returns {serial: stats}."""
+    dirs = rig.output_dirs(output_dir)
+    return rig.run_each(lambda cam: cu.run_video(cam, duration_sec, dirs[str(cam.serial)], prefix, barcode,
+                                                 fps=fps, container=container))
+
+
+def run_timelapse_multi(rig, duration_min, interval_min, path, prefix, barcode, dev, colors, background=False,
+                        fmt="png", compression=3):
+    """Timelapse across every camera of 'rig' on one shared schedule and light state.
+    At each timepoint all cameras are grabbed together (see MultiCameraRig.capture) and
+    frames are saved ("png" or "tiff") under path/<serial>/ by a writer pool sized to the
+    number of cameras.
+    Like run_timelapse, returns the TimelapseScheduler (already running if background)."""
+    total_frames = int(duration_min / interval_min)
+    print(f"⏱️ Capturing {total_frames} frames on {len(rig.cams)} cameras, every {interval_min} minutes")
+
+    if rig.lighting is None:
+        rig.lighting = LightingController(dev)
+    rig.lighting.apply(led_states(False, colors, colors_on=False), settle=False)
+    dirs = rig.output_dirs(path)
+    writer = ImageWriterPool(fmt, compression, workers=2 * len(rig.cams),
+                             index_path=os.path.join(path, f"{prefix}_{barcode}_writes.jsonl"))
+
+    def capture_frame(i):
+        print(f"📸 Capturing frame {i+1}/{total_frames}")
+        frames = rig.capture(led_states(True, colors, colors_on=False))
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        for serial, (frame, _) in frames.items():
+            if frame is None:
+                print(f"⚠️ Camera {serial}: frame {i+1} incomplete. Skipping.")
+                continue
+            writer.submit(frame, os.path.join(dirs[serial], f"{prefix}_{barcode}_{ts}"),
+                          {"frame": i, "camera": serial, "timestamp": ts})
+        rig.lighting.apply(led_states(True, colors, colors_on=True), settle=False)
+
+    def finish():
+        rig.lighting.apply(led_states(False, colors, colors_on=False), settle=False)
+        writer.close()
+        scheduler.write_log(os.path.join(path, f"{prefix}_{barcode}_schedule.csv"))
+
+    scheduler = TimelapseScheduler(capture_frame, total_frames, interval_min * 60, on_finish=finish)
+    if background:
+        return scheduler.start()
+    scheduler.run()
+    return scheduler
@@ -0,0 +1,82 @@
+"""Live preview engine: one continuous acquisition, grabbed and rendered on a background thread."""
+
+import threading
+import time as tm
+
+import utils.frame_ops as fo
+from utils.tracing import tracer
+
+
+class PreviewEngine:
+    """Keeps a single acquisition open on a camera backend for the whole preview and grabs
+    frames on its own thread. The camera runs with a newest-only buffer policy and only the latest frame is
+    kept, so the GUI always shows the freshest image and never waits on the camera.
+
+    Frames are decimated to 'size' (width, height) on the grab thread, straight out of the
+    camera buffer, so the GUI receives a small uint8 buffer it can show without scaling."""
+
+    def __init__(self, cam, size=(640, 480), method="area", timeout_ms=1000):
+        self.cam = cam
+        self.size = size
+        self.method = method
+        self.timeout_ms = timeout_ms
+        self._lock = threading.Lock()
+        self._frame = None
+        self._frame_id = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.fps = 0.0
+        self.render_ms = 0.0
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop.clear()
+        self.cam.start(newest_only=True)
+        self._thread = threading.Thread(target=self._grab_loop, name="preview-grab", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def latest(self, since=0):
+        """Returns (frame_id, frame) for the newest rendered frame, or (since, None) if
+        nothing newer than 'since' has arrived. Frames the caller never picked up are
+        simply skipped."""
+        with self._lock:
+            if self._frame_id <= since:
+                return since, None
+            return self._frame_id, self._frame
+
+    def _render(self, raw):
+        t0 = tm.perf_counter()
+        factor = fo.fit_factor(raw.shape, self.size)
+        np_img = fo.to_display(fo.decimate(raw, factor, self.method))
+        tracer.record("preview.render", t0, tm.perf_counter() - t0)
+        self.render_ms = 0.9 * self.render_ms + 0.1 * (tm.perf_counter() - t0) * 1000
+        return np_img
+
+    def _grab_loop(self):
+        last = tm.monotonic()
+        try:
+            while not self._stop.is_set():
+                with tracer.span("preview.frame"):
+                    np_img, _ = self.cam.get_frame(self.timeout_ms, process=self._render)
+                if np_img is None:
+                    continue
+
+                now = tm.monotonic()
+                self.fps = 0.9 * self.fps + 0.1 / max(now - last, 1e-6)
+                last = now
+                with self._lock:
+                    self._frame = np_img
+                    self._frame_id += 1
+        finally:
+            self.cam.stop()
@@ -0,0 +1,155 @@
+"""Declarative acquisition protocols, run without the GUI."""
+
+import json
+import os
+import time as tm
+
+import utils.cam_utils as cu
+import utils.sequence as seq
+from utils.camera_profile import CameraProfile
+from utils.exposure_cache import ExposureCache
+from utils.led_protocol import LED_ORDER, OFF, ON
+from utils.lighting import LightingController
+
+STEP_KINDS = ("lights", "exposure", "profile", "settings", "capture", "wait", "repeat")
+CAPTURE_MODES = {"single": (), "timelapse": ("duration_min", "interval_min"), "video": ("duration_sec",),
+                 "sequence": ()}
+
+
+def load_protocol(filepath):
+    """Reads and checks a protocol file. A protocol is a JSON object with a "steps" list
+    and optional "name", "output" (directory) and "barcode"; see run_protocol.py for the
+    step types. Raises ValueError naming the first bad step, before anything runs."""
+    with open(filepath) as f:
+        protocol = json.load(f)
+    protocol.setdefault("name", os.path.splitext(os.path.basename(filepath))[0])
+    check_steps(protocol.get("steps"), protocol["name"])
+    return protocol
+
+
+def check_steps(steps, where):
+    if not isinstance(steps, list) or not steps:
+        raise ValueError(f"{where}: 'steps' must be a non-empty list")
+    for i, step in enumerate(steps):
+        kinds = [k for k in STEP_KINDS if k in step]
+        if len(kinds) != 1:
+            raise ValueError(f"{where}, step {i + 1}: expected exactly one of {', '.join(STEP_KINDS)}")
+        if kinds[0] == "capture":
+            if step["capture"] not in CAPTURE_MODES:
+                raise ValueError(f"{where}, step {i + 1}: unknown capture mode {step['capture']!r}")
+            missing = [k for k in CAPTURE_MODES[step["capture"]] if k not in step]
+            if missing:
+                raise ValueError(f"{where}, step {i + 1}: {step['capture']} needs {', '.join(missing)}")
+        if kinds[0] == "lights" and set(step["lights"]) - set(LED_ORDER):
+            raise ValueError(f"{where}, step {i + 1}: unknown LEDs {sorted(set(step['lights']) - set(LED_ORDER))}")
+        if kinds[0] == "repeat":
+            check_steps(step.get("steps"), f"{where}, step {i + 1}")
+
+
+class ProtocolRunner:
+    """Runs protocols on a camera backend and LED device that stay open between them, so
+    back-to-back or queued protocols never re-initialize the hardware. Captures use the
+    cam_utils functions; the light state set by "lights" steps is kept across steps and
+    protocols."""
+
+    def __init__(self, cam, dev=None, output="."):
+        self.cam = cam
+        self.dev = dev
+        self.output = output
+        self.lighting = LightingController(dev, cam)
+        self.exposure_cache = None
+        self.leds = {name: OFF for name in LED_ORDER}
+
+    def run(self, protocol):
+        """Runs every step of a loaded protocol. Returns the elapsed seconds."""
+        t0 = tm.monotonic()
+        name = protocol["name"]
+        output = protocol.get("output", os.path.join(self.output, name))
+        os.makedirs(output, exist_ok=True)
+        print(f"📜 Running protocol '{name}' → {output}")
+        context = {"output": output, "barcode": protocol.get("barcode", "000000"), "prefix": name}
+        self.run_steps(protocol["steps"], context)
+        elapsed = tm.monotonic() - t0
+        print(f"🏁 Protocol '{name}' finished in {elapsed:.1f} s")
+        return elapsed
+
+    def run_steps(self, steps, context):
+        for step in steps:
+            kind = next(k for k in STEP_KINDS if k in step)
+            getattr(self, f"step_{kind}")(step, context)
+
+    def step_lights(self, step, context):
+        """{"lights": {"TRANS": true, "460": false}}: LEDs not named keep their state."""
+        self.leds.update({name: ON if on else OFF for name, on in step["lights"].items()})
+        self.lighting.apply(dict(self.leds), settle=False)
+
+    def step_exposure(self, step, context):
+        """{"exposure": 2000} in μs, or {"exposure": "auto"} for the calibration cache
+        under the current light state."""
+        if step["exposure"] == "auto":
+            if self.exposure_cache is None:
+                self.exposure_cache = ExposureCache()
+            self.exposure_cache.exposure_for(self.cam, self.leds)
+        elif not self.cam.configure(exposure_us=int(step["exposure"])):
+            raise RuntimeError(f"Could not set exposure {step['exposure']}")
+
+    def step_profile(self, step, context):
+        """{"profile": "Aparna"}: applies users/profiles/Aparna.json as a diff."""
+        if CameraProfile.load(step["profile"]).apply(self.cam) is None:
+            raise RuntimeError(f"Could not apply profile {step['profile']!r}")
+
+    def step_settings(self, step, context):
+        """{"settings": {"Gain": 6.0}}: sets camera nodes, writing only those that differ."""
+        current = CameraProfile.snapshot(self.cam)
+        if current.updated(**step["settings"]).apply(self.cam, current) is None:
+            raise RuntimeError("Could not apply settings")
+
+    def step_wait(self, step, context):
+        """{"wait": 30} in seconds."""
+        print(f"⏳ Waiting {step['wait']} s")
+        tm.sleep(step["wait"])
+
+    def step_repeat(self, step, context):
+        """{"repeat": 3, "steps": [...]}: runs the nested steps n times. Each pass adds
+        _r<n> to the file prefix, so repeated captures never overwrite each other."""
+        for n in range(step["repeat"]):
+            print(f"🔁 Repeat {n + 1}/{step['repeat']}")
+            self.run_steps(step["steps"], dict(context, prefix=f"{context['prefix']}_r{n + 1}"))
+
+    def step_capture(self, step, context):
+        """{"capture": "single" | "timelapse" | "video" | "sequence", ...}. "prefix",
+        "barcode" and "output" override the protocol's; other keys go to the cam_utils
+        or sequence function (e.g. "duration_min", "interval_min", "colors", "fmt" for a
+        timelapse, whose "colors" may be a list of wavelengths; "wavelengths" and
+        "exposures" for a sequence, repeated when it has "duration_min" and "interval_min")."""
+        args = {k: v for k, v in step.items() if k not in ("capture", "prefix", "barcode", "output")}
+        output = step.get("output", context["output"])
+        prefix = step.get("prefix", context["prefix"])
+        barcode = step.get("barcode", context["barcode"])
+        os.makedirs(output, exist_ok=True)
+        if step["capture"] == "single":
+            cu.run_single_image(self.cam, output, prefix, barcode)
+        elif step["capture"] == "video":
+            cu.run_video(self.cam, args.pop("duration_sec"), output, prefix, barcode, **args)
+        elif step["capture"] == "sequence":
+            if args.pop("exposure", None) == "auto":
+                if self.exposure_cache is None:
+                    self.exposure_cache = ExposureCache()
+                args["exposure_cache"] = self.exposure_cache
+            if "duration_min" in args:
+                seq.run_sequence_timelapse(self.cam, args.pop("duration_min"), args.pop("interval_min"), output,
+                                           prefix, barcode, self.dev, lighting=self.lighting, **args)
+            else:
+                seq.run_sequence(self.cam, self.dev, output, prefix, barcode, lighting=self.lighting, **args)
+        else:
+            colors = args.pop("colors", [])
+            if isinstance(colors, list):
+                colors = {wl: True for wl in colors}
+            if args.pop("exposure", None) == "auto":
+                if self.exposure_cache is None:
+                    self.exposure_cache = ExposureCache()
+                args["exposure_cache"] = self.exposure_cache
+            cu.run_timelapse(self.cam, args.pop("duration_min"), args.pop("interval_min"), output, prefix, barcode,
+                             self.dev, colors, lighting=self.lighting, **args)
+        # timelapses and sequences end with every LED off: restore the protocol's light state
+        self.lighting.apply(dict(self.leds), settle=False)
@@ -0,0 +1,204 @@
+"""A raw, memory-mapped frame container for high-speed capture.
+
+A .praw file is a 4 KiB header (magic + JSON: dtype, shape, pixel format) followed by
+fixed-size frames back to back. A sidecar .praw.idx file holds one record per frame
+(timestamp, frame ID, byte offset), appended as frames arrive so a file cut short by a
+crash can still be read up to its last complete frame. Nothing is encoded while
+capturing, and any frame can be read back instantly through a memory map."""
+
+import json
+import os
+import time as tm
+
+import cv2
+import numpy as np
+
+import utils.frame_ops as fo
+
+MAGIC = b"PHRAW001"
+HEADER_SIZE = 4096
+INDEX_DTYPE = np.dtype([("timestamp", "<f8"), ("frame_id", "<u8"), ("offset", "<u8")])
+
+
+def pixel_format_for(shape, dtype):
+    """Best-guess GenICam pixel format name for frames of this shape and dtype."""
+    bits = np.dtype(dtype).itemsize * 8
+    return f"RGB{bits}" if len(shape) == 3 else f"Mono{bits}"
+
+
+class RawFrameWriter:
+    """Appends frames to a memory-mapped .praw file. The file grows 'chunk_frames' frames
+    at a time; each chunk is mapped once and frames are copied straight into it, so
+    append() can be used as a backend get_frame() 'process' callback to go from the
+    camera buffer to the page cache with a single copy."""
+
+    def __init__(self, filepath, shape, dtype=np.uint8, pixel_format=None, chunk_frames=256):
+        self.filepath = filepath
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.chunk_frames = chunk_frames
+        self.count = 0
+        header = {
+            "dtype": self.dtype.str,
+            "shape": list(self.shape),
+            "pixel_format": pixel_format or pixel_format_for(self.shape, self.dtype),
+            "frame_bytes": self.frame_bytes,
+            "created": tm.time(),
+        }
+        blob = MAGIC + json.dumps(header).encode()
+        if len(blob) > HEADER_SIZE:
+            raise ValueError("Raw header too large")
+        with open(filepath, "wb") as f:
+            f.write(blob.ljust(HEADER_SIZE, b"\0"))
+        self._index = open(filepath + ".idx", "wb")
+        self._chunk = None
+        self._chunk_start = 0
+
+    def _map_next_chunk(self):
+        if self._chunk is not None:
+            self._chunk.flush()
+        self._chunk_start = self.count
+        offset = HEADER_SIZE + self._chunk_start * self.frame_bytes
+        self._chunk = np.memmap(self.filepath, dtype=self.dtype, mode="r+", offset=offset,
+                                shape=(self.chunk_frames, *self.shape))
+
+    def append(self, frame, timestamp=None, frame_id=None):
+        """Copies one frame into the file and records it in the index. Returns its index."""
+        if self._chunk is None or self.count - self._chunk_start >= self.chunk_frames:
+            self._map_next_chunk()
+        self._chunk[self.count - self._chunk_start] = frame
+        offset = HEADER_SIZE + self.count * self.frame_bytes
+        record = np.array([(tm.time() if timestamp is None else timestamp,
+                            self.count if frame_id is None else frame_id, offset)], dtype=INDEX_DTYPE)
+        self._index.write(record.tobytes())
+        self.count += 1
+        return self.count - 1
+
+    def close(self):
+        if self._chunk is not None:
+            self._chunk.flush()
+            self._chunk = None  # unmap before shrinking the file
+        self._index.close()
+        # Drop the unused tail of the last chunk.
+        with open(self.filepath, "r+b") as f:
+            f.truncate(HEADER_SIZE + self.count * self.frame_bytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RawFrameReader:
+    """Random access to the frames of a .praw file without decoding anything. 'frames' is
+    a read-only (n, H, W[, C]) memory map and 'index' the per-frame records."""
+
+    def __init__(self, filepath):
+        with open(filepath, "rb") as f:
+            blob = f.read(HEADER_SIZE)
+        if not blob.startswith(MAGIC):
+            raise ValueError(f"{filepath} is not a raw frame file")
+        self.header = json.loads(blob[len(MAGIC):].rstrip(b"\0"))
+        self.dtype = np.dtype(self.header["dtype"])
+        self.shape = tuple(self.header["shape"])
+        self.pixel_format = self.header["pixel_format"]
+        self.index = np.fromfile(filepath + ".idx", dtype=INDEX_DTYPE)
+        # Trust only frames that are both indexed and fully on disk.
+        on_disk = (os.path.getsize(filepath) - HEADER_SIZE) // self.header["frame_bytes"]
+        n = min(len(self.index), on_disk)
+        self.index = self.index[:n]
+        self.frames = np.memmap(filepath, dtype=self.dtype, mode="r", offset=HEADER_SIZE,
+                                shape=(n, *self.shape)) if n else np.empty((0, *self.shape), self.dtype)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        return self.frames[i]
+
+    @property
+    def timestamps(self):
+        return self.index["timestamp"]
+
+    @property
+    def is_bayer(self):
+        return self.pixel_format.startswith("Bayer")
+
+    def batches(self, batch=32):
+        """Yields (start, frames) over the file, 'batch' frames at a time, demosaiced to
+        RGB if they are raw Bayer frames."""
+        for a in range(0, len(self), batch):
+            frames = self.frames[a:a + batch]
+            yield a, fo.demosaic(frames, self.pixel_format) if self.is_bayer else frames
+
+
+def transcode(filepath, out_path, fmt="avi", fps=None, writer=None):
+    """Converts a .praw file offline. fmt "avi" (uncompressed) or "mp4" writes one video
+    to out_path; "png"/"tiff" writes one image per frame into the out_path directory
+    through an ImageWriterPool ('writer') if given. fps defaults to the recorded rate.
+    Raw Bayer frames are demosaiced on the way, a batch at a time."""
+    raw = RawFrameReader(filepath)
+    if not len(raw):
+        print("❌ No frames to transcode.")
+        return
+    if fps is None:
+        span = raw.timestamps[-1] - raw.timestamps[0]
+        fps = (len(raw) - 1) / span if len(raw) > 1 and span > 0 else 30.0
+
+    if fmt in ("avi", "mp4"):
+        h, w = raw.shape[:2]
+        is_color = len(raw.shape) == 3 or raw.is_bayer
+        fourcc = 0 if fmt == "avi" else cv2.VideoWriter_fourcc(*"mp4v")
+        video = cv2.VideoWriter(out_path, fourcc, fps, (w, h), is_color)
+        for _, frames in raw.batches():
+            for frame in frames:
+                if frame.dtype != np.uint8:
+                    frame = (frame >> 8).astype(np.uint8)
+                video.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR) if is_color else frame)
+        video.release()
+        print(f"💾 Video saved: {out_path}")
+        return
+
+    from utils.image_writer import ImageWriterPool
+
+    os.makedirs(out_path, exist_ok=True)
+    pool = writer or ImageWriterPool(fmt)
+    stem = os.path.splitext(os.path.basename(filepath))[0]
+    for start, frames in raw.batches():
+        for i, frame in enumerate(frames, start):
+            rec = raw.index[i]
+            if frame.ndim == 3:
+                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)  # the image encoders expect BGR
+            pool.submit(np.array(frame), os.path.join(out_path, f"{stem}_{i:06d}"),
+                        {"timestamp": float(rec["timestamp"]), "frame_id": int(rec["frame_id"])})
+    if writer is None:
+        pool.close()
+
+
+def demosaic_file(filepath, out_path=None, batch=32, processes=None):
+    """Demosaics a .praw file of raw Bayer frames into an RGB .praw (by default next to
+    it, ending in _rgb.praw) with the same timestamps and frame IDs. The frames are
+    converted in batches, spread over 'processes' worker processes if given; meant to run
+    after a capture, or in the background while the next one records. Returns out_path."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    raw = RawFrameReader(filepath)
+    if not raw.is_bayer:
+        raise ValueError(f"{filepath} does not hold Bayer frames ({raw.pixel_format})")
+    out_path = out_path or filepath[:-len(".praw")] + "_rgb.praw"
+    t0 = tm.perf_counter()
+    pool = ProcessPoolExecutor(processes) if processes else None
+    step = batch * 2 * (processes or 1)  # frames in memory at once
+    try:
+        with RawFrameWriter(out_path, (*raw.shape, 3), raw.dtype, chunk_frames=step) as out:
+            for a in range(0, len(raw), step):
+                rgb = fo.demosaic(raw.frames[a:a + step], raw.pixel_format, batch=batch, pool=pool)
+                for frame, rec in zip(rgb, raw.index[a:a + step]):
+                    out.append(frame, float(rec["timestamp"]), int(rec["frame_id"]))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    print(f"🎨 Demosaiced {len(raw)} frames in {tm.perf_counter() - t0:.1f} s: {out_path}")
+    return out_path
@@ -0,0 +1,166 @@
+"""Per-well regions of interest for multi-well plates."""
+
+import json
+import os
+import string
+
+import numpy as np
+
+import utils.frame_ops as fo
+from utils.image_writer import ImageWriterPool
+
+PLATE_LAYOUTS = {6: (2, 3), 12: (3, 4), 24: (4, 6), 48: (6, 8), 96: (8, 12)}
+
+
+class WellGrid:
+    """A rows x cols grid of equally sized, equally spaced wells, in pixels: 'origin' is
+    the (x, y) top-left corner of well A1, 'pitch' the (x, y) distance between wells and
+    'size' the (width, height) of each crop. Because every crop has the same size, all
+    wells are cut out of a frame in one vectorized gather (see crop())."""
+
+    def __init__(self, rows, cols, origin, pitch, size):
+        self.rows, self.cols = int(rows), int(cols)
+        self.origin = tuple(int(v) for v in origin)
+        self.pitch = tuple(int(v) for v in pitch)
+        self.size = tuple(int(v) for v in size)
+        w, h = self.size
+        ys = self.origin[1] + np.arange(self.rows) * self.pitch[1]
+        xs = self.origin[0] + np.arange(self.cols) * self.pitch[0]
+        # (rows, cols, h, w) index arrays into the frame
+        self._iy = ys[:, None, None, None] + np.arange(h)[None, None, :, None]
+        self._ix = xs[None, :, None, None] + np.arange(w)[None, None, None, :]
+
+    @property
+    def labels(self):
+        return [f"{string.ascii_uppercase[r]}{c + 1}" for r in range(self.rows) for c in range(self.cols)]
+
+    def crop(self, frame):
+        """Returns every well of 'frame' as one (n_wells, h, w[, C]) array, A1 first."""
+        wells = frame[self._iy, self._ix]
+        return wells.reshape(self.rows * self.cols, *wells.shape[2:])
+
+    def fits(self, shape):
+        """True if every well lies inside a frame of this shape."""
+        return (self.origin[0] >= 0 and self.origin[1] >= 0
+                and self._ix.max() < shape[1] and self._iy.max() < shape[0])
+
+    def to_dict(self):
+        return {"rows": self.rows, "cols": self.cols, "origin": list(self.origin),
+                "pitch": list(self.pitch), "size": list(self.size)}
+
+    def save(self, filepath):
+        with open(filepath, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, filepath):
+        """Loads a grid template saved with save()."""
+        with open(filepath) as f:
+            return cls(**json.load(f))
+
+    @classmethod
+    def from_plate(cls, frame_shape, wells=24, margin=0.05, fill=0.8):
+        """A template spreading a standard plate layout evenly over the frame, leaving
+        'margin' (fraction of the frame) around it; each crop covers 'fill' of the pitch."""
+        rows, cols = PLATE_LAYOUTS[wells]
+        h, w = frame_shape[:2]
+        pitch = (w * (1 - 2 * margin) / cols, h * (1 - 2 * margin) / rows)
+        size = (pitch[0] * fill, pitch[1] * fill)
+        origin = (w * margin + (pitch[0] - size[0]) / 2, h * margin + (pitch[1] - size[1]) / 2)
+        return cls(rows, cols, origin, pitch, size)
+
+    @classmethod
+    def detect(cls, frame, wells=24):
+        """Finds the well grid on a frame from its row and column intensity profiles: the
+        wells show up as 'rows' and 'cols' runs that differ from the plastic between them.
+        Raises ValueError if the expected number of runs is not found."""
+        rows, cols = PLATE_LAYOUTS[wells]
+        img = frame if frame.ndim == 2 else frame.mean(axis=2)
+        factor = max(1, min(img.shape) // 512)
+        small = fo.decimate(img.astype(np.float32), factor, "area") if factor > 1 else img.astype(np.float32)
+        x_centers, x_pitch, x_width = _find_runs(small.mean(axis=0), cols)
+        y_centers, y_pitch, y_width = _find_runs(small.mean(axis=1), rows)
+        pitch = (x_pitch * factor, y_pitch * factor)
+        size = (x_width * factor, y_width * factor)
+        origin = (x_centers[0] * factor - size[0] / 2, y_centers[0] * factor - size[1] / 2)
+        grid = cls(rows, cols, origin, pitch, size)
+        if not grid.fits(frame.shape):
+            raise ValueError("Detected well grid does not fit in the frame")
+        return grid
+
+
+def _find_runs(profile, n):
+    """Centers, mean spacing and median width of the n runs of a 1-D intensity profile.
+    Wells may be brighter or darker than the plate, so both polarities are tried."""
+    k = max(3, len(profile) // (n * 8)) | 1
+    smooth = np.convolve(profile - profile.mean(), np.ones(k) / k, mode="same")
+    for signal in (smooth, -smooth):
+        above = np.concatenate(([False], signal > 0, [False]))
+        edges = np.flatnonzero(np.diff(above.astype(np.int8)))
+        starts, ends = edges[::2], edges[1::2]
+        if len(starts) == n:
+            centers = (starts + ends - 1) / 2
+            pitch = np.polyfit(np.arange(n), centers, 1)[0] if n > 1 else ends[0] - starts[0]
+            return centers, pitch, np.median(ends - starts)
+    raise ValueError(f"Could not find {n} wells in the intensity profile")
+
+
+class RoiSaver:
+    """Saves the per-well crops of each frame instead of the whole frame, plus an optional
+    overview decimated by 'overview_factor'. With a StackWriter every timepoint becomes
+    one (n_wells, h, w) entry of the stack; with an ImageWriterPool each well goes to its
+    own <path>/<well>/ folder. The grid is saved as <prefix>_<barcode>_wells.json."""
+
+    def __init__(self, grid, path, prefix, barcode, writer, overview_factor=None):
+        self.grid = grid
+        self.path = path
+        self.prefix = prefix
+        self.barcode = barcode
+        self.writer = writer
+        self.overview_factor = overview_factor
+        self._overview_pool = None
+        grid.save(os.path.join(path, f"{prefix}_{barcode}_wells.json"))
+        if not hasattr(writer, "append"):
+            for label in grid.labels:
+                os.makedirs(os.path.join(path, label), exist_ok=True)
+
+    def save(self, frame, timestamp, stamp, metadata=None):
+        """Crops and queues one frame; 'stamp' is the time string used in file names."""
+        wells = self.grid.crop(frame)
+        if hasattr(self.writer, "append"):
+            self.writer.append(wells, timestamp, (metadata or {}).get("leds"))
+        else:
+            for label, well in zip(self.grid.labels, wells):
+                self.writer.submit(well, os.path.join(self.path, label, f"{self.prefix}_{self.barcode}_{stamp}"),
+                                   {**(metadata or {}), "well": label})
+        if self.overview_factor:
+            overview = np.ascontiguousarray(fo.decimate(frame, self.overview_factor, "area"))
+            self._overview_writer().submit(
+                overview, os.path.join(self.path, f"{self.prefix}_{self.barcode}_{stamp}_overview"), metadata)
+
+    def _overview_writer(self):
+        # a stack holds only the crops, so overviews then get a small PNG pool of their own
+        if hasattr(self.writer, "submit"):
+            return self.writer
+        if self._overview_pool is None:
+            self._overview_pool = ImageWriterPool(workers=1)
+        return self._overview_pool
+
+    def close(self):
+        if self._overview_pool is not None:
+            self._overview_pool.close()
+
+
+def resolve_grid(roi, frame):
+    """Turns the 'roi' option of the capture functions into a WellGrid: a WellGrid is used
+    as is, a string is a template file saved with WellGrid.save(), and a plate size (24,
+    96, ...) means the grid is detected on 'frame', falling back to an even template."""
+    if isinstance(roi, WellGrid):
+        return roi
+    if isinstance(roi, str):
+        return WellGrid.load(roi)
+    try:
+        return WellGrid.detect(frame, roi)
+    except ValueError as e:
+        print(f"⚠️ Well detection failed ({e}), using an evenly spaced {roi}-well template.")
+        return WellGrid.from_plate(frame.shape, roi)
@@ -0,0 +1,197 @@
+"""Drift-free scheduling for timelapse acquisitions."""
+
+import csv
+import threading
+import time as tm
+
+import utils.frame_ops as fo
+from utils.tracing import tracer
+
+
+class TimelapseScheduler:
+    """Calls 'capture(i)' for i in range(n_frames) at absolute deadlines start + i * interval
+    on the monotonic clock, so the time spent lighting, capturing and saving a frame never
+    pushes the following frames back. It runs on its own thread when started with start(),
+    or in the caller's thread with run(), and can be paused, resumed and cancelled.
+
+    Time spent paused shifts the remaining deadlines by the same amount. A frame whose
+    deadline has already passed (because the previous capture overran) fires immediately.
+    The planned vs. actual firing time of every frame is kept in 'log'.
+
+    With 'next_interval' the spacing is variable: after frame i is captured,
+    next_interval(i) returns the seconds until frame i + 1 (see AdaptiveInterval), and the
+    run ends once the next frame would fall after 'duration_sec'. 'n_frames' is then
+    re-estimated from the latest interval after every frame."""
+
+    def __init__(self, capture, n_frames, interval_sec, on_finish=None, next_interval=None, duration_sec=None):
+        self.capture = capture
+        self.n_frames = n_frames
+        self.interval_sec = interval_sec
+        self.on_finish = on_finish
+        self.next_interval = next_interval
+        self.duration_sec = duration_sec
+        self.log = []
+        self._offsets = [0.0]
+        self.frames_done = 0
+        self._start = None
+        self._paused = False
+        self._paused_at = None
+        self._pause_total = 0.0
+        self._cancelled = False
+        self._finished = False
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="timelapse", daemon=True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def pause(self):
+        with self._lock:
+            if not self._paused:
+                self._paused = True
+                self._paused_at = tm.monotonic()
+        self._wake.set()
+
+    def resume(self):
+        with self._lock:
+            if self._paused:
+                self._pause_total += tm.monotonic() - self._paused_at
+                self._paused = False
+        self._wake.set()
+
+    def cancel(self):
+        self._cancelled = True
+        self._wake.set()
+
+    def planned(self, i):
+        """Monotonic time at which frame i is due."""
+        paused = self._pause_total
+        if self._paused:
+            paused += tm.monotonic() - self._paused_at
+        last = len(self._offsets) - 1
+        offset = self._offsets[i] if i <= last else self._offsets[last] + (i - last) * self.interval_sec
+        return self._start + paused + offset
+
+    def progress(self):
+        """Returns a snapshot of the run: frames done, total, ETA in seconds and state."""
+        eta = None
+        if self._start is not None and not self._finished:
+            eta = max(0.0, self.planned(self.n_frames - 1) - tm.monotonic())
+        elif self._start is not None:
+            eta = 0.0
+        return {
+            "frame": self.frames_done,
+            "total": self.n_frames,
+            "eta_sec": eta,
+            "paused": self._paused,
+            "cancelled": self._cancelled,
+            "finished": self._finished,
+        }
+
+    def run(self):
+        self._start = tm.monotonic()
+        try:
+            i = 0
+            while i < self.n_frames:
+                if not self._wait_until(i):
+                    print(f"🛑 Timelapse cancelled after {self.frames_done}/{self.n_frames} frames")
+                    break
+                planned = self.planned(i)
+                fired = tm.monotonic()
+                jitter_ms = (fired - planned) * 1000
+                self.log.append({"frame": i, "planned_s": planned - self._start,
+                                 "fired_s": fired - self._start, "jitter_ms": jitter_ms})
+                print(f"⏱️ Frame {i+1}/{self.n_frames} fired {jitter_ms:+.1f} ms from schedule")
+                with tracer.span("timelapse.frame", frame=i):
+                    self.capture(i)
+                self.frames_done = i + 1
+                if self.next_interval is not None and not self._schedule_next(i):
+                    break
+                i += 1
+        finally:
+            self._finished = True
+            if self.on_finish is not None:
+                self.on_finish()
+
+    def _schedule_next(self, i):
+        """Plans frame i + 1 from next_interval(i); False if it falls after duration_sec."""
+        self.interval_sec = self.next_interval(i)
+        self.log[-1]["next_interval_s"] = self.interval_sec
+        offset = self._offsets[-1] + self.interval_sec
+        if self.duration_sec is not None:
+            if offset > self.duration_sec:
+                self.n_frames = i + 1
+                return False
+            self.n_frames = i + 2 + int((self.duration_sec - offset) / self.interval_sec)
+        self._offsets.append(offset)
+        return True
+
+    def write_log(self, filepath):
+        """Saves the per-frame jitter log (and any extra per-frame fields) as a CSV file."""
+        fieldnames = ["frame", "planned_s", "fired_s", "jitter_ms"]
+        for row in self.log:
+            fieldnames += [k for k in row if k not in fieldnames]
+        with open(filepath, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(self.log)
+
+    def _wait_until(self, i):
+        while True:
+            self._wake.clear()
+            if self._cancelled:
+                return False
+            if self._paused:
+                self._wake.wait()
+                continue
+            remaining = self.planned(i) - tm.monotonic()
+            if remaining <= 0:
+                return True
+            self._wake.wait(remaining)
+
+
+class AdaptiveInterval:
+    """Chooses the timelapse interval from how much the scene moves. update() compares each
+    frame with the previous one on a decimated copy (frame_ops.frame_change): at or above
+    'high' the interval is divided by 'step' down to 'min_sec', at or below 'low' it is
+    multiplied by 'step' up to 'max_sec', and in between it is kept. Use it as the
+    scheduler's next_interval; every decision is kept in 'decisions', keyed by frame."""
+
+    def __init__(self, min_sec, max_sec, low=0.005, high=0.02, step=2.0, start_sec=None, factor=8):
+        self.min_sec = min_sec
+        self.max_sec = max_sec
+        self.low = low
+        self.high = high
+        self.step = step
+        self.factor = factor
+        self.interval_sec = min(max(start_sec if start_sec is not None else min_sec, min_sec), max_sec)
+        self.decisions = {}
+        self._previous = None
+
+    def update(self, i, frame):
+        """Measures frame i against the previous one and adjusts the interval."""
+        small = frame[::self.factor, ::self.factor].copy()
+        change = None if self._previous is None else fo.frame_change(small, self._previous, 1)
+        self._previous = small
+        action = "keep"
+        if change is not None and change >= self.high and self.interval_sec > self.min_sec:
+            self.interval_sec, action = max(self.min_sec, self.interval_sec / self.step), "shorten"
+        elif change is not None and change <= self.low and self.interval_sec < self.max_sec:
+            self.interval_sec, action = min(self.max_sec, self.interval_sec * self.step), "lengthen"
+        self.decisions[i] = {"activity": change, "decision": action}
+        if action != "keep":
+            print(f"🔁 Activity {change:.4f}: interval {action}ed to {self.interval_sec:.1f} s")
+        return self.interval_sec
+
+    def __call__(self, i):
+        return self.interval_sec
@@ -0,0 +1,185 @@
+"""Multi-wavelength sequences: one stream, one multi-channel stack per timepoint."""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from utils.led_protocol import LED_ORDER, OFF, ON
+from utils.lighting import LightingController
+from utils.scheduler import TimelapseScheduler
+from utils.stack_store import StackWriter
+from utils.tracing import tracer
+
+WAVELENGTHS = ("460", "535", "590", "670")
+
+
+def _read_exposure(cam):
+    # get_node returns strings on FLIR (ToString()), numbers on the other backends
+    try:
+        return float(cam.get_node("ExposureTime"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _write_tiff(filepath, stack, compression):
+    params = [cv2.IMWRITE_TIFF_COMPRESSION, 5 if compression else 1]  # LZW or none
+    if not cv2.imwritemulti(filepath, list(stack), params):
+        raise IOError(f"Could not write {filepath}")
+
+
+class SequenceEngine:
+    """Captures every wavelength of a sequence in one acquisition stream. For each
+    wavelength the LEDs are switched (acknowledged and settled by LightingController)
+    and the frame is copied straight from the camera buffer into its channel of a
+    preallocated (channels, H, W) stack, so nothing is encoded between one LED and the
+    next. The finished stack is saved on a background thread while the caller moves on,
+    either as a multi-page TIFF per timepoint (fmt="tiff", one page per wavelength) or
+    as one entry per timepoint of a .pstack file (fmt="stack").
+
+    'exposures' maps wavelengths to exposure times (μs); wavelengths without one use the
+    camera's exposure from before the sequence, or the 'exposure_cache' if given. Every timepoint is logged, with the wavelength,
+    timestamp and exposure of each channel, to {prefix}_{barcode}_sequence.jsonl."""
+
+    def __init__(self, cam, dev, path, prefix="seq", barcode="000000", wavelengths=WAVELENGTHS, fmt="tiff",
+                 compression=1, lighting=None, exposures=None, exposure_cache=None, trans=False):
+        self.cam = cam
+        self.path = path
+        self.prefix = prefix
+        self.barcode = barcode
+        self.wavelengths = [str(wl) for wl in wavelengths]
+        self.fmt = fmt
+        self.compression = compression
+        self.lighting = lighting or LightingController(dev, cam)
+        self.exposures = {str(k): v for k, v in (exposures or {}).items()}
+        self.exposure_cache = exposure_cache
+        self.trans = trans
+        self.index_path = os.path.join(path, f"{prefix}_{barcode}_sequence.jsonl")
+        self.timepoints = 0
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._pending = []
+        self._stack_writer = None
+        if fmt == "stack":
+            start = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self._stack_writer = StackWriter(os.path.join(path, f"{prefix}_{barcode}_{start}.pstack"),
+                                             chunk_frames=1, level=compression)
+        elif fmt != "tiff":
+            raise ValueError(f"Unknown sequence format: {fmt}")
+
+    def states_for(self, wl):
+        """LED states with only 'wl' (and the bed, if 'trans') on."""
+        states = {name: OFF for name in LED_ORDER}
+        states[wl] = ON
+        if self.trans:
+            states["TRANS"] = ON
+        return states
+
+    def capture(self, i=None):
+        """Captures one timepoint and queues it for saving. Returns the (channels, H, W)
+        stack, or None if a frame was lost."""
+        i = self.timepoints if i is None else i
+        stack = None
+        channels = []
+        changes_exposure = self.exposures or self.exposure_cache is not None
+        base_exposure = _read_exposure(self.cam) if changes_exposure else None
+        self.cam.start(newest_only=True)
+        try:
+            for c, wl in enumerate(self.wavelengths):
+                states = self.states_for(wl)
+                exposure = self.exposures.get(wl)
+                metered = exposure is None and self.exposure_cache is not None
+                if not metered:
+                    # set before the light, so the settle wait also covers the exposure change
+                    exposure = exposure or base_exposure
+                    if exposure is not None:
+                        self.cam.configure(exposure_us=exposure)
+                with tracer.span("sequence.lights", wavelength=wl):
+                    self.lighting.apply(states)
+                if metered:
+                    exposure = self.exposure_cache.exposure_for(self.cam, states)
+                    self.cam.get_frame(5000)  # may have been exposed before the last change
+
+                def store(buf, c=c):
+                    nonlocal stack
+                    if stack is None:
+                        stack = np.empty((len(self.wavelengths), *buf.shape), dtype=buf.dtype)
+                    stack[c] = buf
+                    return True
+
+                with tracer.span("sequence.get_frame", wavelength=wl):
+                    ok, timestamp = self.cam.get_frame(5000, process=store)
+                if ok is None:
+                    print(f"⚠️ {wl} nm frame of timepoint {i + 1} incomplete. Skipping the timepoint.")
+                    return None
+                channels.append({"wavelength": wl, "timestamp": timestamp, "exposure_us": exposure})
+        finally:
+            self.lighting.apply({name: OFF for name in LED_ORDER}, settle=False)
+            self.cam.stop()
+            if base_exposure is not None:
+                self.cam.configure(exposure_us=base_exposure)
+
+        self._save(i, stack, channels)
+        self.timepoints += 1
+        print(f"🌈 Timepoint {i + 1}: {', '.join(self.wavelengths)} nm captured")
+        return stack
+
+    def _save(self, i, stack, channels):
+        record = {"timepoint": i, "channels": channels}
+        if self._stack_writer is not None:
+            # the writer copies the stack and compresses it on its own thread
+            self._stack_writer.append(stack, channels[0]["timestamp"], record)
+            record["file"] = os.path.basename(self._stack_writer.filepath)
+        else:
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filepath = os.path.join(self.path, f"{self.prefix}_{self.barcode}_{ts}_t{i:04d}.tiff")
+            self._pending = [f for f in self._pending if not f.done()]
+            self._pending.append(self._pool.submit(_write_tiff, filepath, stack, self.compression))
+            record["file"] = os.path.basename(filepath)
+        with open(self.index_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def close(self):
+        """Waits for every stack to be on disk."""
+        for future in self._pending:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"❌ Failed to save a sequence stack: {e}")
+        self._pool.shutdown(wait=True)
+        if self._stack_writer is not None:
+            self._stack_writer.close()
+        print(f"💾 {self.timepoints} sequence timepoint(s) saved in {self.path}")
+
+
+def run_sequence(cam, dev, path, prefix="seq", barcode="000000", **kwargs):
+    """Captures and saves one multi-wavelength timepoint; see SequenceEngine."""
+    engine = SequenceEngine(cam, dev, path, prefix, barcode, **kwargs)
+    try:
+        return engine.capture(0)
+    finally:
+        engine.close()
+
+
+def run_sequence_timelapse(cam, duration_min, interval_min, path, prefix, barcode, dev, background=False,
+                           **kwargs):
+    """Repeats the sequence every 'interval_min' on the drift-free TimelapseScheduler.
+    Like run_timelapse, returns the scheduler (already running if background)."""
+    engine = SequenceEngine(cam, dev, path, prefix, barcode, **kwargs)
+    total_frames = int(duration_min / interval_min)
+    print(f"⏱️ Capturing {total_frames} sequences of {len(engine.wavelengths)} wavelengths, "
+          f"every {interval_min} minutes")
+    tracer.reset()  # the saved trace covers this run only
+
+    def finish():
+        engine.close()
+        scheduler.write_log(os.path.join(path, f"{prefix}_{barcode}_schedule.csv"))
+        tracer.dump(os.path.join(path, f"{prefix}_{barcode}_trace.json"))
+
+    scheduler = TimelapseScheduler(engine.capture, total_frames, interval_min * 60, on_finish=finish)
+    if background:
+        return scheduler.start()
+    scheduler.run()
+    return scheduler
@@ -0,0 +1,167 @@
+"""Threaded ownership of the Arduino serial port."""
+
+import collections
+import queue
+import threading
+import time as tm
+from concurrent.futures import Future
+
+from utils.led_protocol import ARDUINO_BAUD, LED_ORDER, leds_command, parse_reply, wait_for_firmware
+
+
+class SerialManager:
+    """Owns the serial port on its own thread. Commands are queued and answered through
+    futures, so no caller (in particular the GUI thread) ever blocks on the port.
+
+    request() sends one command and resolves to the parsed firmware reply, ("LEDS",
+    {led: status}) or ("LED_<x>_STATUS", value); set_leds() switches every LED and
+    resolves to True once the firmware acknowledges the state. write() keeps the
+    fire-and-forget behaviour of a plain serial.Serial for older helpers. A lost port is
+    reopened automatically, and the round-trip latency of every command is recorded."""
+
+    def __init__(self, port, baudrate=ARDUINO_BAUD, timeout=2, opener=None, reconnect_delay_s=2.0):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.reconnect_delay_s = reconnect_delay_s
+        self._opener = opener or self._open_serial
+        self._dev = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self.latency_ms = collections.deque(maxlen=1000)
+        self.state = {}  # last known LED status, from the firmware's replies
+
+    def _open_serial(self):
+        import serial
+
+        return serial.Serial(self.port, self.baudrate, timeout=self.timeout)
+
+    @property
+    def connected(self):
+        return self._dev is not None
+
+    def start(self, wait=False):
+        """Starts the I/O thread. With wait=True, blocks until the port is open (or the
+        first attempt failed) and returns whether it is connected."""
+        self._thread = threading.Thread(target=self._run, name="serial-io", daemon=True)
+        self._thread.start()
+        if wait:
+            self.request(None).exception()
+        return self.connected if wait else self
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def request(self, command, expect_reply=True):
+        """Queues a command such as "GET LED_460_STATUS;" and returns a Future of its reply."""
+        future = Future()
+        self._queue.put((command, expect_reply, future))
+        return future
+
+    def write(self, data):
+        """Fire-and-forget, like serial.Serial.write. Errors are printed, not raised."""
+        future = self.request(data.decode() if isinstance(data, bytes) else data)
+        future.add_done_callback(self._report_error)
+        return len(data)
+
+    def set_leds(self, states):
+        """Switches every LED at once. The Future resolves to True once acknowledged."""
+        expected = {name: int(states[name]) for name in LED_ORDER}
+        reply = self.request(leds_command(states).decode())
+        done = Future()
+
+        def check(f):
+            if f.exception() is not None:
+                done.set_exception(f.exception())
+            else:
+                done.set_result(f.result() == ("LEDS", expected))
+
+        reply.add_done_callback(check)
+        return done
+
+    def stats(self):
+        """Round-trip latency of recent commands, in ms."""
+        values = sorted(self.latency_ms)
+        if not values:
+            return {"commands": 0}
+        return {"commands": len(values), "p50_ms": values[len(values) // 2],
+                "p95_ms": values[int(len(values) * 0.95)], "max_ms": values[-1]}
+
+    @staticmethod
+    def _report_error(future):
+        if future.exception() is not None:
+            print(f"❌ Serial command failed: {future.exception()}")
+
+    def _connect(self):
+        try:
+            dev = self._opener()
+            if not wait_for_firmware(dev):
+                dev.close()
+                raise IOError("Arduino did not answer")
+            self._dev = dev
+            print(f"🔌 Arduino connected on {self.port}")
+        except Exception as e:
+            self._dev = None
+            print(f"⚠️ Arduino not available on {self.port}: {e}")
+
+    def _disconnect(self):
+        try:
+            self._dev.close()
+        except Exception:
+            pass
+        self._dev = None
+
+    def _run(self):
+        self._connect()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.reconnect_delay_s)
+            except queue.Empty:
+                if self._dev is None:
+                    self._connect()
+                continue
+            if item is None:
+                break
+            command, expect_reply, future = item
+            if self._dev is None:
+                self._connect()
+            if command is None:  # connection probe from start(wait=True)
+                future.set_result(self.connected)
+                continue
+            if self._dev is None:
+                future.set_exception(IOError("Arduino not connected"))
+                continue
+            try:
+                future.set_result(self._transact(command, expect_reply))
+            except Exception as e:
+                print(f"⚠️ Lost Arduino connection: {e}")
+                self._disconnect()
+                future.set_exception(e)
+        if self._dev is not None:
+            self._disconnect()
+
+    def _transact(self, command, expect_reply):
+        if not command.endswith(";"):
+            command += ";"
+        name = command.split()[1] if len(command.split()) > 1 else None
+        name = name.rstrip(";") if name else None
+        t0 = tm.perf_counter()
+        self._dev.write(command.encode())
+        if not expect_reply:
+            return None
+        # Skip stale lines until the reply to this command arrives, or the port times out.
+        while True:
+            line = self._dev.readline()
+            if not line:
+                return None
+            reply = parse_reply(line)
+            if reply is not None and reply[0] == name:
+                self.latency_ms.append((tm.perf_counter() - t0) * 1000)
+                if name == "LEDS":
+                    self.state.update(reply[1])
+                else:
+                    self.state[name[4:-7]] = int(reply[1])
+                return reply
@@ -0,0 +1,224 @@
+"""A chunked, compressed image-stack file for long timelapses.
+
+A .pstack file holds a JSON header (dtype, shape) followed by chunks of consecutive
+frames, each zlib-compressed as one block and preceded by its own small index entry
+(timestamps and LED states of its frames). On close a footer with the whole index is
+appended so it can be loaded in one read; a file that was never closed is still
+readable by walking the chunk entries. Loading a time range decompresses only the
+chunks that overlap it."""
+
+import json
+import struct
+import threading
+import time as tm
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+MAGIC = b"PHSTK001"
+HEADER_SIZE = 4096
+CHUNK_TAG = b"CHNK"
+CHUNK_HEAD = struct.Struct("<4sIQ")  # tag, index entry length, compressed payload length
+FOOTER_TAG = b"INDX"
+END_MARK = b"PSTKEND!"
+FOOTER_TAIL = struct.Struct("<Q8s")  # footer length, end mark
+
+
+class StackWriter:
+    """Appends frames to a .pstack file, 'chunk_frames' at a time. Frames wait in a
+    preallocated chunk array; full chunks are compressed and written on a background
+    thread so the capture path only pays for a copy. Frames not yet in a full chunk are
+    written by flush() and close(); a chunk that fails to write is reported as soon as
+    it is noticed, and close() raises. With 'flush_every_s' a chunk is also written whenever
+    that long has passed since the last write (the first frame is written at once), so a
+    slow timelapse never keeps more than that much of its data only in memory."""
+
+    def __init__(self, filepath, chunk_frames=16, level=1, flush_every_s=None):
+        self.filepath = filepath
+        self.chunk_frames = chunk_frames
+        self.flush_every_s = flush_every_s
+        self._last_flush = None
+        self.level = level
+        self.count = 0
+        self._f = open(filepath, "wb")
+        self._f.write(MAGIC.ljust(HEADER_SIZE, b"\0"))
+        self._header_written = False
+        self._chunk = None
+        self._n = 0
+        self._timestamps = []
+        self._leds = []
+        self._index = []
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1)  # one worker keeps chunks in order
+        self._futures = []
+        self.errors = []
+
+    def _write_header(self, frame):
+        header = json.dumps({"dtype": frame.dtype.str, "shape": list(frame.shape)}).encode()
+        self._f.seek(len(MAGIC))
+        self._f.write(header)
+        self._f.seek(HEADER_SIZE)
+        self._header_written = True
+
+    def append(self, frame, timestamp, leds=None):
+        """Adds one frame with its timestamp (seconds) and optional LED state dict."""
+        if not self._header_written:
+            self._write_header(frame)
+        if self._chunk is None:
+            self._chunk = np.empty((self.chunk_frames, *frame.shape), dtype=frame.dtype)
+            self._n = 0
+        self._chunk[self._n] = frame
+        self._n += 1
+        self._timestamps.append(float(timestamp))
+        self._leds.append(leds)
+        self.count += 1
+        overdue = self.flush_every_s is not None and (
+            self._last_flush is None or tm.monotonic() - self._last_flush >= self.flush_every_s)
+        if self._n == self.chunk_frames or overdue:
+            self.flush()
+
+    def flush(self):
+        """Hands the frames buffered so far to the background writer as one chunk."""
+        if not self._n:
+            return
+        frames = self._chunk[:self._n]
+        entry = {"first": self.count - self._n, "count": self._n,
+                 "timestamps": self._timestamps, "leds": self._leds}
+        self._chunk, self._n, self._timestamps, self._leds = None, 0, [], []
+        self._last_flush = tm.monotonic()
+        self._futures.append(self._pool.submit(self._write_chunk, frames, entry))
+        self._collect()
+
+    def _collect(self, wait=False):
+        # Reports the chunks that failed to write among those finished (all, if 'wait').
+        pending = []
+        for future in self._futures:
+            if not wait and not future.done():
+                pending.append(future)
+            elif future.exception() is not None:
+                self.errors.append(future.exception())
+                print(f"❌ Failed to write a chunk of {self.filepath}: {future.exception()}")
+        self._futures = pending
+
+    def _write_chunk(self, frames, entry):
+        payload = zlib.compress(np.ascontiguousarray(frames).tobytes(), self.level)
+        meta = json.dumps(entry).encode()
+        with self._lock:
+            offset = self._f.tell()
+            self._f.write(CHUNK_HEAD.pack(CHUNK_TAG, len(meta), len(payload)))
+            self._f.write(meta)
+            self._f.write(payload)
+            self._f.flush()
+            self._index.append({**entry, "offset": offset})
+
+    def close(self):
+        self.flush()
+        self._pool.shutdown(wait=True)
+        self._collect(wait=True)
+        footer = FOOTER_TAG + json.dumps(self._index).encode()
+        self._f.write(footer)
+        self._f.write(FOOTER_TAIL.pack(len(footer), END_MARK))
+        self._f.close()
+        if self.errors:
+            lost = self.count - sum(entry["count"] for entry in self._index)
+            raise IOError(f"{lost} frames could not be written to {self.filepath}") from self.errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StackReader:
+    """Reads frames back from a .pstack file. 'timestamps' and 'leds' cover every frame;
+    frames themselves are only decompressed, one chunk at a time, when asked for."""
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath, "rb") as f:
+            blob = f.read(HEADER_SIZE)
+            if not blob.startswith(MAGIC):
+                raise ValueError(f"{filepath} is not an image-stack file")
+            header = json.loads(blob[len(MAGIC):].rstrip(b"\0") or b"{}")
+            self.dtype = np.dtype(header.get("dtype", "|u1"))
+            self.shape = tuple(header.get("shape", ()))
+            self.chunks = self._read_footer(f) or self._scan_chunks(f)
+        self.timestamps = np.array([t for c in self.chunks for t in c["timestamps"]], dtype=np.float64)
+        self.leds = [s for c in self.chunks for s in c["leds"]]
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @staticmethod
+    def _read_footer(f):
+        f.seek(0, 2)
+        size = f.tell()
+        if size < HEADER_SIZE + FOOTER_TAIL.size:
+            return None
+        f.seek(size - FOOTER_TAIL.size)
+        length, mark = FOOTER_TAIL.unpack(f.read(FOOTER_TAIL.size))
+        if mark != END_MARK:
+            return None
+        f.seek(size - FOOTER_TAIL.size - length)
+        footer = f.read(length)
+        return json.loads(footer[len(FOOTER_TAG):])
+
+    @staticmethod
+    def _scan_chunks(f):
+        """Rebuilds the index of a file that was not closed, skipping over the payloads."""
+        chunks = []
+        f.seek(0, 2)
+        size = f.tell()
+        f.seek(HEADER_SIZE)
+        while True:
+            offset = f.tell()
+            head = f.read(CHUNK_HEAD.size)
+            if len(head) < CHUNK_HEAD.size:
+                break
+            tag, meta_len, payload_len = CHUNK_HEAD.unpack(head)
+            if tag != CHUNK_TAG:
+                break
+            if offset + CHUNK_HEAD.size + meta_len + payload_len > size:
+                break  # the last chunk was cut short
+            meta = f.read(meta_len)
+            f.seek(payload_len, 1)
+            chunks.append({**json.loads(meta), "offset": offset})
+        return chunks
+
+    def _load_chunk(self, f, chunk):
+        f.seek(chunk["offset"])
+        _, meta_len, payload_len = CHUNK_HEAD.unpack(f.read(CHUNK_HEAD.size))
+        f.seek(meta_len, 1)
+        data = zlib.decompress(f.read(payload_len))
+        return np.frombuffer(data, dtype=self.dtype).reshape(chunk["count"], *self.shape)
+
+    def read_range(self, t_start=None, t_end=None):
+        """Returns (frames, timestamps, leds) for frames with t_start <= timestamp <= t_end
+        (either bound may be None). Only the chunks overlapping the range are read."""
+        frames, stamps, leds = [], [], []
+        with open(self.filepath, "rb") as f:
+            for chunk in self.chunks:
+                ts = np.asarray(chunk["timestamps"])
+                keep = np.ones(len(ts), dtype=bool)
+                if t_start is not None:
+                    keep &= ts >= t_start
+                if t_end is not None:
+                    keep &= ts <= t_end
+                if not keep.any():
+                    continue
+                frames.append(self._load_chunk(f, chunk)[keep])
+                stamps.append(ts[keep])
+                leds.extend(s for s, k in zip(chunk["leds"], keep) if k)
+        if not frames:
+            return np.empty((0, *self.shape), self.dtype), np.empty(0), []
+        return np.concatenate(frames), np.concatenate(stamps), leds
+
+    def frame(self, i):
+        """Returns frame i, decompressing only its chunk."""
+        for chunk in self.chunks:
+            if chunk["first"] <= i < chunk["first"] + chunk["count"]:
+                with open(self.filepath, "rb") as f:
+                    return self._load_chunk(f, chunk)[i - chunk["first"]]
+        raise IndexError(i)
@@ -0,0 +1,138 @@
+"""Per-stage timing of the acquisition paths, exportable as a Chrome trace."""
+
+import bisect
+import collections
+import json
+import os
+import threading
+import time as tm
+
+# Upper edges (ms) of the histogram buckets, roughly 1-2-5 per decade
+BUCKETS_MS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf")]
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = tm.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, tm.perf_counter() - self.start, self.args)
+        return False
+
+
+class Tracer:
+    """Times named stages ("get_frame", "encode", "lights.ack", ...) with the monotonic
+    perf_counter clock. Use it as
+
+        with tracer.span("encode"):
+            ...
+
+    While disabled, span() returns a shared no-op context manager, so instrumented code
+    pays one attribute check per stage. While enabled, every span is kept (the last
+    'max_events') for export_chrome_trace(), whose JSON loads in chrome://tracing or
+    Perfetto, and the last 'window' durations of each stage feed stats() and histogram()."""
+
+    def __init__(self, enabled=False, max_events=100_000, window=1000):
+        self.enabled = enabled
+        self.window = window
+        self.events = collections.deque(maxlen=max_events)
+        self.durations = {}
+        self._origin = tm.perf_counter()
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name, start, duration, args=None):
+        """Records a stage that started at perf_counter() time 'start' and took 'duration' s."""
+        if not self.enabled:
+            return
+        self.events.append((name, start, duration, threading.get_ident(), args))
+        stage = self.durations.get(name)
+        if stage is None:
+            stage = self.durations.setdefault(name, collections.deque(maxlen=self.window))
+        stage.append(duration * 1000)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.events.clear()
+        self.durations.clear()
+        self._origin = tm.perf_counter()
+
+    def stats(self):
+        """Count, mean, median, 95th percentile and max duration (ms) of each stage over
+        its rolling window."""
+        result = {}
+        for name, stage in list(self.durations.items()):
+            values = sorted(stage)
+            if not values:
+                continue
+            result[name] = {"count": len(values), "mean_ms": sum(values) / len(values),
+                            "p50_ms": values[len(values) // 2],
+                            "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+                            "max_ms": values[-1]}
+        return result
+
+    def histogram(self, name):
+        """Counts of the stage's recent durations per BUCKETS_MS bucket, as
+        {upper edge in ms: count}."""
+        counts = [0] * len(BUCKETS_MS)
+        for value in list(self.durations.get(name, ())):
+            counts[bisect.bisect_left(BUCKETS_MS, value)] += 1
+        return dict(zip(BUCKETS_MS, counts))
+
+    def summary(self):
+        """Prints the per-stage statistics, slowest stage first."""
+        stats = self.stats()
+        for name, s in sorted(stats.items(), key=lambda item: -item[1]["mean_ms"] * item[1]["count"]):
+            print(f"⏲️ {name:<24} n={s['count']:<6} mean {s['mean_ms']:8.2f} ms  p50 {s['p50_ms']:8.2f}  "
+                  f"p95 {s['p95_ms']:8.2f}  max {s['max_ms']:8.2f}")
+        return stats
+
+    def export_chrome_trace(self, filepath):
+        """Writes the recorded spans in the Chrome trace event format."""
+        pid = os.getpid()
+        events = [{"name": name, "cat": name.split(".")[0], "ph": "X", "pid": pid, "tid": tid,
+                   "ts": (start - self._origin) * 1e6, "dur": duration * 1e6, "args": args or {}}
+                  for name, start, duration, tid, args in list(self.events)]
+        names = {t.ident: t.name for t in threading.enumerate()}
+        events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": names[tid]}}
+                   for tid in {e["tid"] for e in events} if tid in names]
+        with open(filepath, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"🧭 Trace saved: {filepath} ({len(events)} events)")
+
+    def dump(self, filepath):
+        """Prints the summary and exports the trace, if tracing is enabled."""
+        if self.enabled and self.events:
+            self.summary()
+            self.export_chrome_trace(filepath)
+
+
+# Shared by all acquisition code; set PHENOTYPEOMAT_TRACE=1 to enable it from the start.
+tracer = Tracer(enabled=os.environ.get("PHENOTYPEOMAT_TRACE") == "1")